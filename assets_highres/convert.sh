@@ -9,3 +9,5 @@ do
   mv *.webp ../../assets/$dir/
   cd ..
 done
+# pre-encoded images for the app, optional
+PYTHONPATH=../src python -m festokes_repair.images
@@ -0,0 +1,429 @@
+"""Compute backends shared by all sessions of the app.
+
+A backend runs validations on a fixed number of workers. Identical card
+combinations that are queued or running are solved once and the result is
+handed to every session waiting for it; queued work is taken round-robin
+from the sessions, so one session cannot starve the others.
+
+    python -m festokes_repair.backend --sessions 60 --workers 4
+
+simulates a classroom clicking Validate at once and prints the metrics.
+"""
+import abc
+import argparse
+import contextlib
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import metrics
+from .cache import result_cache
+from .table import result_table
+
+# "thread" solves inside the app process, "process" on a pool of worker
+# processes.
+BACKEND = os.environ.get("FESTOKES_BACKEND", "thread")
+# Validations running at the same time, over all sessions, on the process
+# backend. The thread backend runs one at a time unless told otherwise:
+# solves in one process take turns on the TaskManager anyway.
+WORKERS = int(os.environ.get("FESTOKES_WORKERS", 0)) or min(4, os.cpu_count() or 1)
+# Validations waiting for a worker before new ones are turned away.
+MAX_QUEUE = int(os.environ.get("FESTOKES_MAX_QUEUE", 256))
+
+
+class Cancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Ticket:
+    """A session waiting for the result of one card combination."""
+
+    def __init__(self, backend, session, config, on_progress, on_done, on_error):
+        self.backend = backend
+        self.session = session
+        self.config = config
+        # the task the ticket waits for, the preview of a table hit
+        self.task_config = config
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self._finished = threading.Event()
+
+    def cancel(self):
+        self.backend.withdraw(self)
+
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def _progress(self, level, nlevels, phase):
+        if not self.cancelled and self.on_progress is not None:
+            self.on_progress(level, nlevels, phase)
+
+    def _finish(self, result=None, error=None):
+        try:
+            if self.cancelled:
+                pass
+            elif error is not None:
+                if self.on_error is not None:
+                    self.on_error(error)
+            elif self.on_done is not None:
+                self.on_done(result)
+        finally:
+            self._finished.set()
+
+
+class _Task:
+    def __init__(self, config):
+        self.id = next(_task_ids)
+        self.config = config
+        self.waiters = []
+        self.running = False
+        self.cancel = threading.Event()
+
+
+_task_ids = itertools.count()
+
+
+class Backend(abc.ABC):
+    """Scheduling, merging and metrics; subclasses run the tasks.
+
+    Callbacks of a ticket are called on a backend thread, a ticket that was
+    cancelled gets none; a full queue fails a ticket with QueueFull. A
+    table hit stored without fields calls on_done twice: at once with the
+    fields None, then with the fields of the coarsest level, solved by a
+    normal task. A task whose sessions all left is dropped while queued and
+    stopped if the backend can, otherwise it runs to the end and only fills
+    the cache.
+    """
+
+    def __init__(self, workers=None, max_queue=None):
+        self.workers = workers or WORKERS
+        self.max_queue = MAX_QUEUE if max_queue is None else max_queue
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._counts = Counter()
+        # the first lookup fingerprints the solver code, which loads the FE
+        # stack; that must not hold up the session that submits
+        self._lookups = ThreadPoolExecutor(max_workers=1, thread_name_prefix="festokes-lookup")
+
+    def submit(self, session, config, on_progress=None, on_done=None, on_error=None):
+        ticket = Ticket(self, session, config, on_progress, on_done, on_error)
+        self._lookups.submit(self._lookup, ticket)
+        return ticket
+
+    def _lookup(self, ticket):
+        """Answer ``ticket`` from the cache or the table, else queue it."""
+        try:
+            if ticket.cancelled:
+                return
+            result = result_cache.get(ticket.config)
+            if result is not None:
+                with self._lock:
+                    self._counts["cache_hits"] += 1
+                ticket._finish(result)
+                return
+            table = result_table()
+            result = table.get(ticket.config) if table is not None else None
+            if result is not None:
+                with self._lock:
+                    self._counts["table_hits"] += 1
+                if result["fields"] is None and ticket.on_done is not None:
+                    self._preview(ticket, result)
+                else:
+                    ticket._finish(result)
+                return
+            self._queue(ticket)
+        except Exception as e:
+            ticket._finish(error=e)
+
+    def _preview(self, ticket, result):
+        """Answer the verdict of a table hit now and queue the solve of the
+        coarsest level for its fields; the ticket waits for that one."""
+        on_done = ticket.on_done
+        if not ticket.cancelled:
+            on_done(result)
+        ticket.on_done = lambda preview: on_done(dict(result, fields=preview["fields"]))
+        ticket.on_progress = ticket.on_error = None
+        ticket.task_config = ticket.config._replace(nref=1)
+        preview = result_cache.get(ticket.task_config)
+        if preview is not None:
+            ticket._finish(preview)
+            return
+        try:
+            self._queue(ticket)
+        except QueueFull:
+            ticket._finished.set()
+
+    def _queue(self, ticket):
+        config = ticket.task_config
+        with self._lock:
+            if ticket.cancelled:
+                return
+            self._counts["submitted"] += 1
+            task = self._tasks.get(config)
+            if task is not None:
+                self._counts["merged"] += 1
+                task.cancel.clear()
+            else:
+                if self._queued >= self.max_queue:
+                    self._counts["rejected"] += 1
+                    raise QueueFull("too many validations waiting, please try again in a moment")
+                task = self._tasks[config] = _Task(config)
+                self._queues.setdefault(ticket.session, deque()).append(task)
+                self._queued += 1
+            task.waiters.append(ticket)
+            self._dispatch()
+
+    def withdraw(self, ticket):
+        with self._lock:
+            if ticket.done() or ticket.cancelled:
+                return
+            ticket.cancelled = True
+            task = self._tasks.get(ticket.task_config)
+            if task is not None and ticket in task.waiters:
+                task.waiters.remove(ticket)
+                if not task.waiters:
+                    self._counts["cancelled"] += 1
+                    task.cancel.set()
+        ticket._finished.set()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._counts, workers=self.workers, running=self._running,
+                        queued=self._queued, sessions_waiting=len(self._queues),
+                        max_queue=self.max_queue)
+
+    def _dispatch(self):
+        while self._running < self.workers and self._queues:
+            session, tasks = next(iter(self._queues.items()))
+            task = tasks.popleft()
+            self._queued -= 1
+            if tasks:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            if task.cancel.is_set():
+                del self._tasks[task.config]
+                continue
+            task.running = True
+            self._running += 1
+            try:
+                self._start(task)
+            except Exception as e:
+                # finished on another thread, we hold the lock here
+                threading.Thread(target=self._finish, args=(task, None, e), daemon=True).start()
+
+    @abc.abstractmethod
+    def _start(self, task):
+        """Start running ``task``; call _finish when it is done."""
+
+    def _progress(self, task, level, nlevels, phase):
+        with self._lock:
+            waiters = list(task.waiters)
+        for ticket in waiters:
+            ticket._progress(level, nlevels, phase)
+
+    def _finish(self, task, result=None, error=None):
+        if result is not None:
+            result_cache.put(task.config, result)
+            metrics.record(task.config, result)
+        with self._lock:
+            self._running -= 1
+            task.running = False
+            if isinstance(error, Cancelled) and task.waiters:
+                # asked for again while it was being stopped
+                self._queues.setdefault(task.waiters[0].session, deque()).appendleft(task)
+                self._queued += 1
+                self._dispatch()
+                return
+            del self._tasks[task.config]
+            waiters, task.waiters = task.waiters, []
+            if isinstance(error, Cancelled):
+                pass
+            elif error is not None:
+                self._counts["failed"] += 1
+            else:
+                self._counts["completed"] += 1
+            self._dispatch()
+        for ticket in waiters:
+            ticket._finish(result, error)
+
+
+class ThreadBackend(Backend):
+    """Solves in threads of this process; abandoned tasks stop at the next phase.
+
+    The solves take turns (see solver.task_manager), so by default there is
+    one worker; more only start solves that then wait for the TaskManager.
+    """
+
+    def __init__(self, workers=None, max_queue=None, solve=None):
+        super().__init__(workers or int(os.environ.get("FESTOKES_WORKERS", 0)) or 1, max_queue)
+        self.solve = solve
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix="festokes-validate")
+
+    def _start(self, task):
+        self._executor.submit(self._run, task)
+
+    def _run(self, task):
+        def progress(level, nlevels, phase):
+            if task.cancel.is_set():
+                raise Cancelled()
+            self._progress(task, level, nlevels, phase)
+
+        solve = self.solve
+        try:
+            if solve is None:  # the FE stack is loaded by the first validation
+                from .solver import solve_stokes_n as solve
+            result = solve(task.config, progress=progress)
+        except Exception as e:
+            self._finish(task, error=e)
+        else:
+            self._finish(task, result)
+
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+    from . import solver  # preload the FE stack before the first task
+
+
+def _solve_in_worker(task_id, config):
+    from .solver import solve_stokes_n
+
+    def progress(level, nlevels, phase):
+        _progress_queue.put((task_id, level, nlevels, phase))
+
+    with contextlib.redirect_stdout(sys.stderr):
+        return solve_stokes_n(config, progress=progress)
+
+
+class ProcessPoolBackend(Backend):
+    """Solves on a pool of worker processes; results come back pickled.
+
+    Workers are spawned, not forked, as the app process runs NGSolve and
+    webapp threads. Abandoned running tasks finish and fill the cache.
+    """
+
+    def __init__(self, workers=None, max_queue=None):
+        super().__init__(workers, max_queue)
+        self._context = multiprocessing.get_context("spawn")
+        self._progress_queue = self._context.Queue()
+        self._pool = self._new_pool()
+        self._by_id = {}
+        threading.Thread(target=self._forward_progress, daemon=True,
+                         name="festokes-progress").start()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(self._progress_queue,))
+
+    def _start(self, task):
+        try:
+            future = self._pool.submit(_solve_in_worker, task.id, task.config)
+        except BrokenProcessPool:
+            # a worker died, the tasks it had failed with it; start afresh
+            self._pool.shutdown(wait=False)
+            self._pool = self._new_pool()
+            future = self._pool.submit(_solve_in_worker, task.id, task.config)
+        self._by_id[task.id] = task
+        # a future that is done already calls back right here, under the lock
+        # _dispatch holds, which _finish takes again
+        future.add_done_callback(
+            lambda f: threading.Thread(target=self._done, args=(task, f), daemon=True).start())
+
+    def _done(self, task, future):
+        self._by_id.pop(task.id, None)
+        try:
+            result = future.result()
+        except Exception as e:
+            self._finish(task, error=e)
+        else:
+            self._finish(task, result)
+
+    def _forward_progress(self):
+        while True:
+            try:
+                task_id, level, nlevels, phase = self._progress_queue.get()
+            except (EOFError, OSError):
+                return
+            task = self._by_id.get(task_id)
+            if task is not None:
+                self._progress(task, level, nlevels, phase)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def default_backend():
+    """The process-wide backend selected by FESTOKES_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND == "thread":
+                _backend = ThreadBackend()
+            elif BACKEND == "process":
+                _backend = ProcessPoolBackend()
+            else:
+                raise ValueError(f"unknown backend {BACKEND!r}")
+            if metrics.PORT is not None:
+                metrics.serve(metrics.PORT, _backend)
+        return _backend
+
+
+def main(argv=None):
+    from .batch import configurations
+    from .cards import mesh_cards
+    parser = argparse.ArgumentParser(prog="python -m festokes_repair.backend",
+                                     description="Simulate many sessions validating at once.")
+    parser.add_argument("--sessions", type=int, default=60)
+    parser.add_argument("--combinations", type=int, default=10,
+                        help="distinct card combinations the sessions pick from")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--backend", choices=["thread", "process"], default=BACKEND)
+    args = parser.parse_args(argv)
+
+    configs = list(itertools.islice(configurations(meshes=list(mesh_cards)[:1], extras=[()]),
+                                    args.combinations))
+    cls = ThreadBackend if args.backend == "thread" else ProcessPoolBackend
+    backend = cls(args.workers, args.max_queue)
+    start = time.perf_counter()
+    tickets = []
+    with contextlib.redirect_stdout(sys.stderr):
+        for session in range(args.sessions):
+            tickets.append(backend.submit(session, configs[session % len(configs)],
+                                          on_error=lambda e, s=session: print(f"session {s}: {e}")))
+        print("after submit:", backend.metrics())
+        waiting = deque(tickets)
+        while waiting:
+            if not waiting[0].wait(1.0):
+                print(backend.metrics())
+                continue
+            waiting.popleft()
+    print(f"done in {time.perf_counter() - start:.1f}s:", backend.metrics())
+
+
+if __name__ == "__main__":
+    main()
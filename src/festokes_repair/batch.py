@@ -0,0 +1,223 @@
+"""Headless evaluation of card combinations.
+
+    python -m festokes_repair.batch -o scores.jsonl
+    python -m festokes_repair.batch --mesh "Curved Mesh" --velocity P2 P3 -j 8 -o th.csv
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .cards import (basic_points, configuration, extra_cards, mesh_cards, mesh_key,
+                    pressure_cards, total_points, velocity_cards)
+
+FIELDS = [
+    "mesh", "pressure", "velocity", "extras", "nref",
+    "basic_points", "optconv", "prrob", "is_stable", "total_points",
+    "eoc_v_h1", "eoc_p_l2", "eocs",
+    "error_v_l2", "error_v_l2_2", "error_v_h1semi", "error_v_h1semi2",
+    "error_v_divl2", "error_p_l2", "convergence", "inf_sup", "spurious_modes",
+    "num_threads", "phase_times", "levels", "speedup", "time", "error",
+]
+
+
+def _cards(options):
+    return [name for name in options if name != "None"]
+
+
+def configurations(meshes=None, pressures=None, velocities=None,
+                   extras=None, max_extras=1, nref=3):
+    """All card combinations, "None" cards excluded unless asked for.
+
+    ``extras`` is a list of extra-card sets; by default every set of up to
+    ``max_extras`` distinct extra cards is used, including the empty one.
+    """
+    if extras is None:
+        extras = [()]
+        for n in range(1, max_extras + 1):
+            extras += itertools.combinations(_cards(extra_cards), n)
+    seen = set()
+    for mesh, pressure, velocity, extra in itertools.product(
+            meshes or _cards(mesh_cards), pressures or _cards(pressure_cards),
+            velocities or _cards(velocity_cards), extras):
+        config = configuration(mesh, pressure, velocity, extra, nref)
+        if config not in seen:
+            seen.add(config)
+            yield config
+
+
+def _row(config):
+    return dict(config._asdict(), extras=",".join(config.extras),
+                basic_points=basic_points(config))
+
+
+def _scored(row, config, result):
+    from . import solver
+    row.update({k: v for k, v in result.items() if k in FIELDS})
+    row["convergence"] = solver.convergence_records(result["convergence"])
+    row["total_points"] = total_points(config, result)
+    return row
+
+
+def evaluate(config, num_threads=1, speedup=False, linear_solver=None, precheck=None,
+             condense=None):
+    """Score one combination. With ``speedup`` it is solved a second time
+    on a single thread and the per-phase ratio serial/threaded is reported."""
+    from . import solver
+    row = _row(config)
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = solver.solve_stokes_n(config, num_threads, linear_solver, precheck,
+                                           condense=condense)
+            row["time"] = time.perf_counter() - start
+            if speedup:
+                serial = solver.solve_stokes_n(config, 1, linear_solver, precheck,
+                                               condense=condense)["phase_times"]
+                row["speedup"] = {phase: serial[phase] / t if t > 0 else None
+                                  for phase, t in result["phase_times"].items()}
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        row["time"] = time.perf_counter() - start
+    else:
+        _scored(row, config, result)
+    return row
+
+
+def evaluate_many(configs, num_threads=1, linear_solver=None, precheck=None, condense=None):
+    """Score several combinations with solver.solve_stokes_many, sharing
+    what they have in common. The time of a row is the sum of its phases,
+    shared work counts for the first combination that needed it."""
+    from . import solver
+    with contextlib.redirect_stdout(sys.stderr):
+        results = solver.solve_stokes_many(configs, num_threads, linear_solver, precheck,
+                                           condense)
+    rows = []
+    for config, result in zip(configs, results):
+        row = _row(config)
+        if isinstance(result, Exception):
+            row["error"] = f"{type(result).__name__}: {result}"
+            row["time"] = 0.0
+        else:
+            row["time"] = sum(result["phase_times"].values())
+            _scored(row, config, result)
+        rows.append(row)
+    return rows
+
+
+def sweeps(configs):
+    """``configs`` split into the groups evaluate_many shares most in: one
+    velocity card on one mesh, with every pressure and extra card."""
+    groups = {}
+    for config in configs:
+        groups.setdefault((mesh_key(config), config.velocity), []).append(config)
+    return list(groups.values())
+
+
+class JsonlWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, row):
+        self.f.write(json.dumps(row) + "\n")
+        self.f.flush()
+
+
+class CsvWriter:
+    def __init__(self, f):
+        self.f = f
+        self.writer = csv.DictWriter(f, FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow({k: json.dumps(v) if isinstance(v, (list, dict)) else v
+                              for k, v in row.items()})
+        self.f.flush()
+
+
+def _single(*args):
+    return [evaluate(*args)]
+
+
+def _nref(value):
+    return value if value == "auto" else int(value)
+
+
+def _extra_set(value):
+    return tuple(e.strip() for e in value.split(",") if e.strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m festokes_repair.batch",
+                                     description="Score card combinations without the webapp.")
+    parser.add_argument("--mesh", nargs="+", choices=list(mesh_cards))
+    parser.add_argument("--pressure", nargs="+", choices=list(pressure_cards))
+    parser.add_argument("--velocity", nargs="+", choices=list(velocity_cards))
+    parser.add_argument("--extras", nargs="+", type=_extra_set, metavar="EXTRA[,EXTRA...]",
+                        help='extra-card sets to combine with, "" for none')
+    parser.add_argument("--max-extras", type=int, default=1,
+                        help="size of the extra-card sets enumerated when --extras is not given")
+    parser.add_argument("--nref", type=_nref, default=3,
+                        help='number of refinement levels, or "auto" for adaptive depth')
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=1,
+                        help="TaskManager threads per process")
+    parser.add_argument("--solver", choices=["auto", "direct", "minres", "gmres"],
+                        help="linear solver, default from FESTOKES_SOLVER or auto")
+    parser.add_argument("--precheck", choices=["off", "report", "reject"],
+                        help="algebraic inf-sup check, default from FESTOKES_PRECHECK or off")
+    parser.add_argument("--condense", choices=["off", "on", "hdg"],
+                        help="static condensation before the direct solve, default from "
+                             "FESTOKES_CONDENSE or off; hdg also hybridizes interior penalty, "
+                             "a different discretization with its own errors")
+    parser.add_argument("--speedup", action="store_true",
+                        help="also solve on one thread and report the per-phase speedup")
+    parser.add_argument("--no-share", action="store_true",
+                        help="solve every combination on its own instead of sharing meshes "
+                             "and velocity blocks between those on the same mesh and velocity")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSONL or CSV (by extension) output file, default stdout")
+    args = parser.parse_args(argv)
+
+    for extra_set in args.extras or []:
+        for e in extra_set:
+            if e not in extra_cards:
+                parser.error(f"unknown extra card {e!r}")
+    configs = list(configurations(args.mesh, args.pressure, args.velocity,
+                                  args.extras, args.max_extras, args.nref))
+    print(f"evaluating {len(configs)} combinations on {args.jobs} processes "
+          f"with {args.threads} threads each",
+          file=sys.stderr)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = CsvWriter(out) if args.output.endswith(".csv") else JsonlWriter(out)
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            if args.speedup or args.no_share:
+                futures = [pool.submit(_single, config, args.threads, args.speedup,
+                                       args.solver, args.precheck, args.condense)
+                           for config in configs]
+            else:
+                futures = [pool.submit(evaluate_many, sweep, args.threads,
+                                       args.solver, args.precheck, args.condense)
+                           for sweep in sweeps(configs)]
+            i = 0
+            for future in as_completed(futures):
+                for row in future.result():
+                    i += 1
+                    writer.write(row)
+                    print(f"[{i}/{len(configs)}] {row['mesh']} / {row['pressure']} / "
+                          f"{row['velocity']} {row['extras']}: {row['time']:.1f}s",
+                          file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
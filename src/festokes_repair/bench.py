@@ -0,0 +1,192 @@
+"""Benchmark of representative card combinations.
+
+    python -m festokes_repair.bench --save baseline.json
+    python -m festokes_repair.bench --compare baseline.json
+
+Every combination and depth runs in a fresh process, so peak RSS and
+compile caches are per case. The reported time is the best of --repeat
+runs. With --compare the exit status is 1 if a case got slower or bigger
+than the baseline by more than --threshold.
+
+The "startup" case times importing the app and creating a session in a
+fresh interpreter; it also fails if that loads any of HEAVY_MODULES. It is
+skipped where webapp_client, which the app needs, is not installed.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .cards import configuration
+
+CASES = {
+    "taylor-hood": ("Unstructured Mesh", "P1", "P2", ()),
+    "taylor-hood-curved": ("Curved Mesh", "P1", "P2", ()),
+    "crouzeix-raviart": ("Unstructured Mesh", "P0", "Crouzeix-Raviart", ()),
+    "bdm2": ("Unstructured Mesh", "P1*", "BDM2", ()),
+    "scott-vogelius-alfeld": ("Unstructured Mesh", "P1*", "P2", ("Alfeld Split",)),
+    "scott-vogelius-powell-sabin": ("Unstructured Mesh", "P0", "P1", ("Powell-Sabin Split",)),
+    "interior-penalty": ("Unstructured Mesh", "P1*", "P2*", ("Interior Penalty",)),
+    "p3-bubble": ("Unstructured Mesh", "P1", "P1", ("P3 Bubble",)),
+}
+DEPTHS = (2, 3, 4, 5)
+# slowdowns smaller than this many seconds are noise, whatever the ratio
+MIN_DELTA = 0.05
+# only to be imported once the first validation starts
+HEAVY_MODULES = ("ngsolve", "netgen", "plotly", "scipy")
+
+_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+from festokes_repair.appconfig import config
+imported = time.perf_counter()
+config.python_class()
+created = time.perf_counter()
+print(json.dumps({"import": imported - start, "session": created - imported,
+                  "heavy_modules": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def startup(repeat=3):
+    """Best time over ``repeat`` fresh interpreters to import the app and
+    create a session."""
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _STARTUP % (HEAVY_MODULES,)],
+                             capture_output=True, text=True, check=True).stdout
+        row = json.loads(out.splitlines()[-1])
+        row["time"] = row["import"] + row["session"]
+        if best is None or row["time"] < best["time"]:
+            best = row
+    return best
+
+
+def run_case(name, nref, repeat=3, num_threads=1):
+    from . import solver
+    mesh, pressure, velocity, extras = CASES[name]
+    config = configuration(mesh, pressure, velocity, extras, nref)
+    best = None
+    with contextlib.redirect_stdout(sys.stderr):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = solver.solve_stokes_n(config, num_threads)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, result)
+    elapsed, result = best
+    levels = result["levels"]
+    return {
+        "time": elapsed,
+        "phase_times": result["phase_times"],
+        "ndof": levels[-1]["ndof"],
+        "nnz": levels[-1]["nnz"],
+        "peak_rss_mb": solver.peak_rss_mb(),
+        "is_stable": result["is_stable"],
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return the regressions of ``results`` against ``baseline`` as text lines."""
+    regressions = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if key == "startup":
+            if new["heavy_modules"]:
+                regressions.append(f"startup: imports {', '.join(new['heavy_modules'])}")
+            if (old is not None and new["time"] > old["time"] * (1 + threshold)
+                    and new["time"] - old["time"] > MIN_DELTA):
+                regressions.append(f"startup: time {old['time']:.3f}s -> {new['time']:.3f}s")
+            continue
+        if old is None:
+            continue
+        if new["time"] > old["time"] * (1 + threshold) and new["time"] - old["time"] > MIN_DELTA:
+            slow = [f"{phase} {old['phase_times'].get(phase, 0):.3f}s -> {t:.3f}s"
+                    for phase, t in new["phase_times"].items()
+                    if t > old["phase_times"].get(phase, 0) * (1 + threshold) and t - old["phase_times"].get(phase, 0) > MIN_DELTA]
+            regressions.append(f"{key}: time {old['time']:.3f}s -> {new['time']:.3f}s"
+                               + (f" ({', '.join(slow)})" if slow else ""))
+        if (new["peak_rss_mb"] and old["peak_rss_mb"]
+                and new["peak_rss_mb"] > old["peak_rss_mb"] * (1 + threshold)):
+            regressions.append(f"{key}: peak RSS {old['peak_rss_mb']:.0f} MB -> {new['peak_rss_mb']:.0f} MB")
+        if new["ndof"] != old["ndof"]:
+            regressions.append(f"{key}: ndof changed {old['ndof']} -> {new['ndof']}")
+        if new["is_stable"] != old["is_stable"]:
+            regressions.append(f"{key}: verdict changed, is_stable {old['is_stable']} -> {new['is_stable']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m festokes_repair.bench",
+                                     description="Time representative card combinations.")
+    parser.add_argument("--case", nargs="+", choices=list(CASES) + ["startup"],
+                        default=list(CASES) + ["startup"])
+    parser.add_argument("--nref", nargs="+", type=int, default=list(DEPTHS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1,
+                        help="TaskManager threads, 1 for the most reproducible timings")
+    parser.add_argument("--save", metavar="FILE", help="write the results as the new baseline")
+    parser.add_argument("--compare", metavar="FILE", help="baseline to check the results against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative slowdown / memory growth, default 0.25")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    if "startup" in args.case and importlib.util.find_spec("webapp_client") is None:
+        print(f"{'startup':40s} skipped, webapp_client is not installed", flush=True)
+    elif "startup" in args.case:
+        results["startup"] = row = startup(args.repeat)
+        line = (f"{'startup':40s} {row['time']:8.3f}s  import {row['import']:.3f}s, "
+                f"session {row['session']:.3f}s")
+        if row["heavy_modules"]:
+            line += f", loads {', '.join(row['heavy_modules'])}"
+        if baseline is not None and "startup" in baseline:
+            line += f"  (baseline {baseline['startup']['time']:.3f}s)"
+        print(line, flush=True)
+    for name in args.case:
+        if name == "startup":
+            continue
+        for nref in args.nref:
+            key = f"{name}/nref={nref}"
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results[key] = row = pool.submit(run_case, name, nref, args.repeat, args.threads).result()
+            line = (f"{key:40s} {row['time']:8.3f}s  {row['ndof']:8d} dofs  "
+                    f"{row['peak_rss_mb'] or 0:7.0f} MB")
+            if baseline is not None and key in baseline:
+                line += f"  (baseline {baseline[key]['time']:.3f}s)"
+            print(line, flush=True)
+
+    if args.save:
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "cpus": os.cpu_count(), "threads": args.threads, "repeat": args.repeat}
+        try:
+            import ngsolve
+            meta["ngsolve"] = ngsolve.__version__
+        except ImportError:
+            pass
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} REGRESSION(S) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print("  " + line, file=sys.stderr)
+            return 1
+        print(f"\nno regressions beyond {args.threshold:.0%}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Bounded LRU cache of validation results with an optional on-disk store.
+
+    Results are kept pickled, so every lookup hands out fresh objects
+    (including the finest-level fields for the webgui) and sessions never
+    share mutable state.
+
+    Stored results are tagged with ``fingerprint()`` (table.fingerprint by
+    default), the solver code and settings they were computed with; those
+    of another fingerprint are ignored.
+    """
+
+    def __init__(self, maxsize=64, directory=None, fingerprint=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.fingerprint = fingerprint or _solver_fingerprint
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr((self.fingerprint(), key)).encode()).hexdigest()
+        return os.path.join(self.directory, digest + ".pickle")
+
+    def _remember(self, key, data):
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            elif self.directory is not None:
+                try:
+                    with open(self._path(key), "rb") as f:
+                        fingerprint, stored_key, data = pickle.load(f)
+                except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                    return None
+                if stored_key != key or fingerprint != self.fingerprint():
+                    return None
+                self._remember(key, data)
+            else:
+                return None
+        return pickle.loads(data)
+
+    def put(self, key, result):
+        data = pickle.dumps(result)
+        with self._lock:
+            self._remember(key, data)
+            if self.directory is not None:
+                path = self._path(key)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    pickle.dump((self.fingerprint(), key, data), f)
+                os.replace(tmp, path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _solver_fingerprint():
+    from .table import fingerprint
+    return fingerprint()
+
+
+result_cache = ResultCache(
+    maxsize=int(os.environ.get("FESTOKES_CACHE_SIZE", 64)),
+    directory=os.environ.get("FESTOKES_CACHE_DIR") or None,
+)
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+mesh_cards = {
+    "Unstructured Mesh": {"image": "mesh/stdmesh.webp", "points": 2},
+    "Curved Mesh": {"image": "mesh/curvedmesh.webp", "points": 4},
+    "Type One Mesh": {"image": "mesh/typeonemesh.webp", "points": 1},
+    "Singular Vertex Mesh": {"image": "mesh/crisscross.webp", "points": 3},
+    "None": {"image": "mesh/emptymesh.webp", "points": 0},
+}
+
+pressure_cards = {
+    "P0": {"image": "pressure/Pzeropressure.webp", "points": 1},
+    "P1": {"image": "pressure/Ponepressure.webp", "points": 2},
+    "P1*": {"image": "pressure/Ponedpressure.webp", "points": 2},
+    "P2": {"image": "pressure/Ptwopressure.webp", "points": 3},
+    "P2*": {"image": "pressure/Ptwodpressure.webp", "points": 3},
+    "P3": {"image": "pressure/Pthreepressure.webp", "points": 4},
+    "P3*": {"image": "pressure/Pthreedpressure.webp", "points": 4},
+    "None": {"image": "pressure/emptypressure.webp", "points": 0},
+}
+
+velocity_cards = {
+    "P1": {"image": "velocity/Ponevel.webp", "points": 4},
+    "P1*": {"image": "velocity/Ponedvel.webp", "points": 4},
+    "BDM1": {"image": "velocity/BDMonevel.webp", "points": 4},
+    "Crouzeix-Raviart": {"image": "velocity/CRvel.webp", "points": 4},
+    "P2": {"image": "velocity/Ptwovel.webp", "points": 3},
+    "P2*": {"image": "velocity/Ptwodvel.webp", "points": 3},
+    "BDM2": {"image": "velocity/BDMtwovel.webp", "points": 3},
+    "P3": {"image": "velocity/Pthreevel.webp", "points": 2},
+    "P3*": {"image": "velocity/Pthreedvel.webp", "points": 2},
+    "BDM3": {"image": "velocity/BDMthreevel.webp", "points": 2},
+    "BDM4": {"image": "velocity/BDMfourvel.webp", "points": 1},
+    "P4": {"image": "velocity/Pfourvel.webp", "points": 1},
+    "P4*": {"image": "velocity/Pfourdvel.webp", "points": 1},
+    "None": {"image": "velocity/emptyvel.webp", "points": 0},
+}
+
+extra_cards = {
+    "Interior Penalty": {"image": "extra/ipdg.webp", "points": 0},
+    "Pressure-Jump": {"image": "extra/pj.webp", "points": -1},
+    "Powell-Sabin Split": {"image": "extra/psmesh.webp", "points": -1},
+    "Alfeld Split": {"image": "extra/alfeldsplit.webp", "points": -1},
+    "Brezzi-Pitkäranta": {"image": "extra/bp.webp", "points": -2},
+    "P3 Bubble": {"image": "extra/Pthreebubble.webp", "points": -1},
+    "None": {"image": "extra/emptyextra.webp", "points": 0},
+}
+
+
+# extras that split the mesh instead of changing the discretization
+mesh_extras = ("Alfeld Split", "Powell-Sabin Split")
+
+Configuration = namedtuple("Configuration", "mesh pressure velocity extras nref")
+
+
+def configuration(mesh, pressure, velocity, extras=(), nref=3):
+    """Normalized card combination: "None" extras are dropped and the
+    remaining extras are sorted, since their order does not matter."""
+    extras = tuple(sorted(e for e in extras if e is not None and e != "None"))
+    return Configuration(mesh, pressure, velocity, extras, nref)
+
+
+def mesh_key(config):
+    """Combinations with the same key are solved on the same meshes."""
+    return config.mesh, tuple(e for e in config.extras if e in mesh_extras)
+
+
+def basic_points(config):
+    points = 0
+    points += mesh_cards.get(config.mesh, {}).get("points", 0)
+    points += pressure_cards.get(config.pressure, {}).get("points", 0)
+    points += velocity_cards.get(config.velocity, {}).get("points", 0)
+    for e in config.extras:
+        points += extra_cards.get(e, {}).get("points", 0)
+    return points
+
+
+def total_points(config, result):
+    if not result["is_stable"]:
+        return 0
+    return basic_points(config) + (result["optconv"] or 0) + result["prrob"]
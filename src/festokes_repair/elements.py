@@ -0,0 +1,136 @@
+"""Finite elements and form terms behind the cards.
+
+Every velocity and pressure card maps to an Element, the family, order and
+continuity of the space together with the factory that creates it on a
+mesh; pressure stabilization extras map to the term they add to the
+form. discretization() resolves a card combination once, StokesSystem
+only reads the result. A new card needs its entry here and in cards.py.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import ngsolve as ngs
+
+Element = namedtuple("Element", "family order discontinuous space")
+Stabilization = namedtuple("Stabilization", "term dgjumps")
+Discretization = namedtuple(
+    "Discretization",
+    "velocity pressure interior_penalty bubble graddiv stabilizations dgjumps")
+
+
+def _h1_velocity(mesh, order, dgjumps=False):
+    print("Create P", order, "CG")
+    return ngs.VectorH1(mesh, order=order, dgjumps=dgjumps, dirichlet=".*")
+
+
+def _l2_velocity(mesh, order, dgjumps=False):
+    print("Create P", order, "DG")
+    return ngs.VectorL2(mesh, order=order, dgjumps=dgjumps)
+
+
+def _hdiv_velocity(mesh, order, dgjumps=False):
+    print("Create BDM of order", order)
+    return ngs.HDiv(mesh, order=order, dgjumps=dgjumps)
+
+
+def _cr_velocity(mesh, order, dgjumps=False):
+    print("Create Crouzeix-Raviart")
+    return ngs.FESpace("nonconforming", mesh, order=order, dirichlet=".*",
+                       dgjumps=dgjumps) ** 2
+
+
+def hdg_velocity(mesh, order):
+    """Discontinuous velocity with facet unknowns for the hybridized
+    interior penalty form."""
+    print("Create P", order, "HDG")
+    return ngs.VectorL2(mesh, order=order) * ngs.VectorFacetFESpace(mesh, order=order,
+                                                                    dirichlet=".*")
+
+
+def p3_bubbles(mesh):
+    """The cubic bubble of every element, to enrich a velocity space."""
+    print("Add P3 Bubble")
+    Vhs = ngs.VectorH1(mesh, order=3)
+    bubbles = ngs.BitArray(Vhs.ndof)
+    bubbles.Clear()
+    for el in Vhs.Elements(ngs.VOL):
+        dofs = Vhs.GetDofNrs(ngs.NodeId(ngs.CELL, el.nr))
+        bubbles.Set(dofs[0])
+    return ngs.Compress(Vhs, active_dofs=bubbles)
+
+
+def _l2_pressure(mesh, order, dgjumps=False):
+    print(f"Create L2({order})")
+    return ngs.L2(mesh, order=order)
+
+
+def _h1_pressure(mesh, order, dgjumps=False):
+    print(f"Create H1({order})")
+    return ngs.H1(mesh, order=order)
+
+
+VELOCITY_ELEMENTS = {
+    "P1": Element("P", 1, False, _h1_velocity),
+    "P2": Element("P", 2, False, _h1_velocity),
+    "P3": Element("P", 3, False, _h1_velocity),
+    "P4": Element("P", 4, False, _h1_velocity),
+    "P1*": Element("P", 1, True, _l2_velocity),
+    "P2*": Element("P", 2, True, _l2_velocity),
+    "P3*": Element("P", 3, True, _l2_velocity),
+    "P4*": Element("P", 4, True, _l2_velocity),
+    "BDM1": Element("BDM", 1, False, _hdiv_velocity),
+    "BDM2": Element("BDM", 2, False, _hdiv_velocity),
+    "BDM3": Element("BDM", 3, False, _hdiv_velocity),
+    "BDM4": Element("BDM", 4, False, _hdiv_velocity),
+    "Crouzeix-Raviart": Element("CR", 1, False, _cr_velocity),
+}
+
+PRESSURE_ELEMENTS = {
+    "P0": Element("P", 0, True, _l2_pressure),
+    "P1": Element("P", 1, False, _h1_pressure),
+    "P2": Element("P", 2, False, _h1_pressure),
+    "P3": Element("P", 3, False, _h1_pressure),
+    "P1*": Element("P", 1, True, _l2_pressure),
+    "P2*": Element("P", 2, True, _l2_pressure),
+    "P3*": Element("P", 3, True, _l2_pressure),
+}
+
+
+def _brezzi_pitkaranta(p, q, h):
+    return -h**2 * ngs.grad(p) * ngs.grad(q) * ngs.dx
+
+
+def _pressure_jump(p, q, h):
+    return -h * (p - p.Other()) * (q - q.Other()) * ngs.dx(skeleton=True)
+
+
+PRESSURE_STABILIZATIONS = {
+    "Brezzi-Pitkäranta": Stabilization(_brezzi_pitkaranta, False),
+    "Pressure-Jump": Stabilization(_pressure_jump, True),
+}
+
+
+@lru_cache(maxsize=None)
+def discretization(velocity, pressure, extras=()):
+    """The elements and form terms of a card combination; extras that only
+    change the mesh are ignored here."""
+    try:
+        velocity_element = VELOCITY_ELEMENTS[velocity]
+    except KeyError:
+        raise ValueError(f"unknown velocity card {velocity!r}") from None
+    try:
+        pressure_element = PRESSURE_ELEMENTS[pressure]
+    except KeyError:
+        raise ValueError(f"unknown pressure card {pressure!r}") from None
+    interior_penalty = "Interior Penalty" in extras
+    stabilizations = tuple(PRESSURE_STABILIZATIONS[e] for e in extras
+                           if e in PRESSURE_STABILIZATIONS)
+    return Discretization(
+        velocity=velocity_element,
+        pressure=pressure_element,
+        interior_penalty=interior_penalty,
+        bubble="P3 Bubble" in extras and velocity_element.order < 3,
+        graddiv="graddiv" in extras,
+        stabilizations=stabilizations,
+        dgjumps=interior_penalty or any(s.dgjumps for s in stabilizations),
+    )
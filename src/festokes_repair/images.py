@@ -0,0 +1,63 @@
+"""Card images as data URLs, encoded once per process and shared by all
+sessions.
+
+    python -m festokes_repair.images
+
+writes assets/bundle.json with every image pre-encoded; it is used instead
+of the image files if present (assets_highres/convert.sh regenerates it).
+An entry whose image changed size since is encoded from the file again.
+"""
+import json
+import os
+import sys
+import threading
+from functools import lru_cache
+
+ASSETS = os.path.join(os.path.dirname(__file__), "assets")
+BUNDLE = os.path.join(ASSETS, "bundle.json")
+
+_bundle = None
+_bundle_lock = threading.Lock()
+
+
+def _load_bundle():
+    global _bundle
+    with _bundle_lock:
+        if _bundle is None:
+            try:
+                with open(BUNDLE) as f:
+                    _bundle = json.load(f)
+            except FileNotFoundError:
+                _bundle = {}
+        return _bundle
+
+
+@lru_cache(maxsize=None)
+def image(filename):
+    path = os.path.join(ASSETS, filename)
+    entry = _load_bundle().get(filename)
+    if entry is not None and entry["size"] == os.path.getsize(path):
+        return entry["data"]
+    from webapp_client.utils import load_image
+    return load_image(path)
+
+
+def bundle():
+    """Encode every image below assets/ into BUNDLE."""
+    from webapp_client.utils import load_image
+    entries = {}
+    for root, dirs, files in os.walk(ASSETS):
+        for name in sorted(files):
+            if not name.endswith(".webp"):
+                continue
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, ASSETS).replace(os.sep, "/")
+            entries[filename] = {"size": os.path.getsize(path), "data": load_image(path)}
+    with open(BUNDLE, "w") as f:
+        json.dump(entries, f)
+    return entries
+
+
+if __name__ == "__main__":
+    entries = bundle()
+    print(f"{len(entries)} images written to {BUNDLE}", file=sys.stderr)
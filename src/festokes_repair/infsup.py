@@ -0,0 +1,114 @@
+"""Algebraic estimate of the discrete inf-sup (LBB) constant.
+
+The square of beta_h is the smallest eigenvalue of the pressure Schur
+complement S = B A^-1 B^T - C relative to the pressure mass matrix, where
+A, B, C are the blocks of the assembled, unregularized Stokes matrix. A
+constant pressure in the kernel of S (enclosed flow) is not counted.
+"""
+import warnings
+
+import numpy as np
+import ngsolve as ngs
+import scipy.linalg
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+from .solver import StokesSystem
+
+# pressure spaces up to this size are handled by a dense eigensolver
+DENSE_MAX_NDOF = 1500
+# eigenvalues of S relative to M are bounded by the dimension, so eigenvalues
+# below ZERO_TOL count as kernel
+ZERO_TOL = 1e-8
+# beta_h shrinking by this factor from one level to the next is a decaying
+# (h-dependent) inf-sup constant
+DECAY = 0.6
+
+
+def _csr(mat):
+    return sp.csr_matrix(mat.CSR())
+
+
+def _smallest_eigenvalues(S, M, constant, k=4):
+    n = M.shape[0]
+    if n <= DENSE_MAX_NDOF:
+        dense = S(np.eye(n))
+        return scipy.linalg.eigh(0.5 * (dense + dense.T), M.toarray(),
+                                 eigvals_only=True)
+    op = spla.LinearOperator((n, n), matvec=S, matmat=S, dtype=float)
+    mlu = spla.splu(M.tocsc())
+    pre = spla.LinearOperator((n, n), matvec=mlu.solve, matmat=mlu.solve, dtype=float)
+    rng = np.random.default_rng(0)
+    Y = constant[:, None] if constant is not None else None
+    with warnings.catch_warnings():
+        # only the kernel/no-kernel split matters, not the last digits
+        warnings.simplefilter("ignore", UserWarning)
+        small = spla.lobpcg(op, rng.standard_normal((n, k)), B=M, M=pre, Y=Y,
+                            largest=False, tol=1e-6, maxiter=200)[0]
+    if constant is not None:
+        small = np.concatenate([[0.0], small])
+    return np.sort(small)
+
+
+def inf_sup_constant(config, mesh, exact):
+    """Return (beta_h, number of spurious pressure modes) on ``mesh``.
+
+    beta_h is None when the velocity block itself is singular.
+    """
+    system = StokesSystem(config, mesh, exact, solver="minres")  # unregularized
+    system.a.Assemble()
+    mass = ngs.BilinearForm(system.p * system.q * ngs.dx).Assemble()
+    fes = system.fes
+    K = _csr(system.a.mat)
+    prange = fes.Range(len(fes.components) - 1)
+    pdofs = np.arange(prange.start, prange.stop)
+    vfree = np.array(fes.FreeDofs(), dtype=bool)
+    vfree[pdofs] = False
+    vdofs = np.flatnonzero(vfree)
+
+    A = K[vdofs][:, vdofs].tocsc()
+    Bt = K[vdofs][:, pdofs]
+    B = K[pdofs][:, vdofs]
+    C = K[pdofs][:, pdofs]
+    M = _csr(mass.mat)[pdofs][:, pdofs]
+    try:
+        lu = spla.splu(A)
+    except RuntimeError:
+        return None, None
+
+    def S(x):
+        return B @ lu.solve(np.asarray(Bt @ x)) - C @ x
+
+    gfc = ngs.GridFunction(system.Q)
+    gfc.Set(1)
+    constant = gfc.vec.FV().NumPy().copy()
+    in_kernel = abs(constant @ S(constant)) <= ZERO_TOL * (constant @ (M @ constant))
+
+    lam = _smallest_eigenvalues(S, M, constant if in_kernel else None)
+    kernel = int(np.sum(lam <= ZERO_TOL))
+    expected = 1 if in_kernel else 0
+    beta = float(np.sqrt(max(lam[min(expected, len(lam) - 1)], 0.0)))
+    return beta, max(kernel - expected, 0)
+
+
+def precheck(config, hierarchy, exact, nlevels=2):
+    """Estimate beta_h on the coarsest levels of ``hierarchy``.
+
+    The pair is flagged unstable if the velocity block is singular, if there
+    are spurious pressure modes on the finest checked level, or if beta_h
+    decays by more than DECAY per refinement.
+    """
+    betas, spurious = [], []
+    for ref in range(nlevels):
+        beta, modes = inf_sup_constant(config, hierarchy.level(ref), exact)
+        betas.append(beta)
+        spurious.append(modes)
+    if betas[-1] is None:
+        stable = False
+    elif spurious[-1] > 0:
+        stable = False
+    elif nlevels > 1 and betas[-2] and betas[-1] / betas[-2] < DECAY:
+        stable = False
+    else:
+        stable = True
+    return {"inf_sup": betas, "spurious_modes": spurious, "stable": stable}
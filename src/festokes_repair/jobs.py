@@ -0,0 +1,39 @@
+import threading
+
+from .backend import default_backend
+
+
+class ValidationRunner:
+    """Runs the validations of one app session on the shared backend.
+
+    At most one job per session is active: submitting another card
+    combination cancels the running one, submitting the same one again is
+    ignored. Callbacks are called on a backend thread; ``on_done`` and
+    ``on_error`` are not called for cancelled jobs, ``on_error`` gets
+    QueueFull when too many validations are waiting.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or default_backend()
+        self.ticket = None
+        self._lock = threading.Lock()
+
+    def submit(self, config, on_progress=None, on_done=None, on_error=None):
+        with self._lock:
+            if self.ticket is not None and not self.ticket.done():
+                if self.ticket.config == config:
+                    return self.ticket
+                self.ticket.cancel()
+            self.ticket = self.backend.submit(self, config, on_progress, on_done, on_error)
+            return self.ticket
+
+    def cancel(self):
+        with self._lock:
+            if self.ticket is not None:
+                self.ticket.cancel()
+
+    def wait(self, timeout=None):
+        """Block until the current job is finished, for headless use."""
+        ticket = self.ticket
+        if ticket is not None:
+            ticket.wait(timeout)
@@ -0,0 +1,92 @@
+"""Structured records of the validations computed by this process.
+
+FESTOKES_METRICS_LOG=<file> appends one JSON line per validation, with the
+per-level ndof, nnz, factor nnz, RSS after the factorization and phase
+times. FESTOKES_METRICS_PORT=<port> serves the totals as Prometheus text on
+/metrics, on FESTOKES_METRICS_HOST (default 127.0.0.1, only this machine).
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG = os.environ.get("FESTOKES_METRICS_LOG") or None
+PORT = int(os.environ.get("FESTOKES_METRICS_PORT", 0)) or None
+HOST = os.environ.get("FESTOKES_METRICS_HOST", "127.0.0.1")
+
+_lock = threading.Lock()
+_counts = Counter()
+_phase_seconds = Counter()
+_peak_rss_mb = 0.0
+
+
+def record(config, result):
+    global _peak_rss_mb
+    levels = result.get("levels", [])
+    entry = dict(config._asdict(), timestamp=time.time(),
+                 is_stable=result["is_stable"], num_threads=result.get("num_threads"),
+                 phase_times=result["phase_times"], levels=levels)
+    with _lock:
+        _counts["validations"] += 1
+        if not result["is_stable"]:
+            _counts["unstable"] += 1
+        _counts["levels"] += len(levels)
+        _counts["dofs"] += sum(level.get("ndof", 0) for level in levels)
+        _phase_seconds.update(result["phase_times"])
+        for level in levels:
+            _peak_rss_mb = max(_peak_rss_mb, level.get("rss_mb") or 0.0)
+        if LOG is not None:
+            with open(LOG, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def prometheus_text(backend=None):
+    with _lock:
+        lines = [
+            "# TYPE festokes_validations_total counter",
+            f"festokes_validations_total {_counts['validations']}",
+            "# TYPE festokes_validations_unstable_total counter",
+            f"festokes_validations_unstable_total {_counts['unstable']}",
+            "# TYPE festokes_levels_total counter",
+            f"festokes_levels_total {_counts['levels']}",
+            "# TYPE festokes_dofs_total counter",
+            f"festokes_dofs_total {_counts['dofs']}",
+            "# TYPE festokes_phase_seconds_total counter",
+        ]
+        lines += [f'festokes_phase_seconds_total{{phase="{phase}"}} {t:.6f}'
+                  for phase, t in sorted(_phase_seconds.items())]
+        lines += ["# TYPE festokes_peak_rss_megabytes gauge",
+                  f"festokes_peak_rss_megabytes {_peak_rss_mb:.1f}"]
+    if backend is not None:
+        for name, value in sorted(backend.metrics().items()):
+            kind = "gauge" if name in ("workers", "running", "queued", "sessions_waiting",
+                                       "max_queue") else "counter"
+            metric = f"festokes_backend_{name}" + ("_total" if kind == "counter" else "")
+            lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def serve(port, backend=None, host=None):
+    """Serve prometheus_text() on /metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(backend).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or HOST, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="festokes-metrics").start()
+    return server
@@ -0,0 +1,976 @@
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+import netgen.occ as ngocc
+import ngsolve as ngs
+import numpy as np
+
+from .cards import mesh_key
+from .elements import discretization, hdg_velocity, p3_bubbles
+
+# Threads of the NGSolve TaskManager per validation. On a shared server a
+# handful of threads per solve serves concurrent sessions better than one
+# solve grabbing every core.
+NUM_THREADS = int(os.environ.get("FESTOKES_NUM_THREADS", 0)) or min(4, os.cpu_count() or 1)
+
+PHASES = ("mesh", "split", "curve", "precheck", "spaces", "assembly", "factorization",
+          "solve", "errors")
+
+# Linear solver for the saddle-point system: "direct" factors the
+# regularized system with sparsecholesky, "minres" and "gmres" iterate on the
+# unregularized one with a block-diagonal preconditioner. "auto" is the
+# direct solver: on the card meshes it beats minres at every size measured
+# so far, e.g. 0.5s against 70s for P1/P2 at nref=5, and minres does not
+# converge at all for some unstable pairs.
+SOLVER = os.environ.get("FESTOKES_SOLVER", "auto")
+# A Krylov solve that has not reduced the residual by KRYLOV_TOL after
+# KRYLOV_MAXITER iterations or BUDGET_SECONDS fails the validation. It checks
+# for cancellation every KRYLOV_CHECK_EVERY iterations.
+KRYLOV_TOL = 1e-10
+KRYLOV_MAXITER = 2000
+KRYLOV_CHECK_EVERY = 20
+
+# Scalings s of the pressure gradient in the extra right hand sides
+# -nu lap u + s grad p that measure pressure robustness; all right hand
+# sides are solved with the one factorization.
+RHS_SCALINGS = tuple(float(s) for s in os.environ.get("FESTOKES_RHS_SCALINGS", "20").split(","))
+
+# Algebraic inf-sup check on the two coarsest levels before the convergence
+# study (needs scipy): "off", "report" adds the estimate to the result,
+# "reject" also skips the study for pairs it finds unstable.
+PRECHECK = os.environ.get("FESTOKES_PRECHECK", "off")
+
+# Compile the exact-solution coefficient functions to C++ (needs a compiler
+# at runtime) instead of only flattening the expression trees.
+REALCOMPILE = bool(int(os.environ.get("FESTOKES_REALCOMPILE", 0)))
+
+# Static condensation of the element-interior velocity dofs before a direct
+# factorization: "off", "on" where the form allows it (no dgjumps couplings,
+# no discontinuous velocity), "hdg" also replaces the interior penalty form
+# of discontinuous velocities by a hybridized one with facet unknowns, which
+# condenses down to the facets. That is a different discretization: its
+# errors, and so possibly its rates and verdicts, differ from the interior
+# penalty ones. The result table and the on-disk cache are fingerprinted
+# with CONDENSE, so results of the settings never mix.
+CONDENSE = os.environ.get("FESTOKES_CONDENSE", "off")
+
+# Adaptive refinement depth (nref="auto"): solve at least MIN_LEVELS levels,
+# stop as soon as the verdict is clear-cut, i.e. every rate is VERDICT_MARGIN
+# away from its threshold (an optimal rate is 0.25 away from both of its
+# own), or the EOCs have settled within EOC_TOL, and never go beyond
+# MAX_LEVELS or BUDGET_NDOF unknowns. The depth depends on the errors only,
+# not on timings, so verdicts can be cached.
+MIN_LEVELS = 2
+MAX_LEVELS = 5
+EOC_TOL = 0.1
+VERDICT_MARGIN = 0.15
+ERROR_FLOOR = 1e-7
+BUDGET_NDOF = int(os.environ.get("FESTOKES_BUDGET_NDOF", 500000))
+# Wall-clock limit of a single Krylov solve.
+BUDGET_SECONDS = float(os.environ.get("FESTOKES_BUDGET_SECONDS", 30))
+
+# Finest levels the EOCs are least-squares fitted over. 2 is the classic
+# rate between the last two levels, more levels average out wiggles of a
+# study that is not quite asymptotic yet.
+EOC_FIT_LEVELS = int(os.environ.get("FESTOKES_EOC_FIT_LEVELS", 2))
+
+_task_manager_lock = threading.RLock()
+_task_manager_depth = threading.local()
+
+
+@contextmanager
+def task_manager(num_threads=None):
+    """Run the enclosed block inside an NGSolve TaskManager.
+
+    NGSolve crashes when a TaskManager is exited on another thread than the
+    one that entered it, so every outermost block enters and exits its own,
+    with ``num_threads`` threads, while holding a process-wide lock: solves
+    in threads of one process take turns, each using all its threads.
+    Nested blocks of the same thread run in the outer TaskManager.
+    """
+    with _task_manager_lock:
+        depth = getattr(_task_manager_depth, "value", 0)
+        _task_manager_depth.value = depth + 1
+        try:
+            if depth:
+                yield
+            else:
+                ngs.SetNumThreads(num_threads or NUM_THREADS)
+                with ngs.TaskManager():
+                    yield
+        finally:
+            _task_manager_depth.value = depth
+
+
+def solver_mode(solver=None):
+    solver = solver or SOLVER
+    if solver not in ("auto", "direct", "minres", "gmres"):
+        raise ValueError(f"unknown solver {solver!r}")
+    if solver == "auto":
+        return "direct"
+    return solver
+
+
+@contextmanager
+def timed(times, phase, progress=None):
+    """Add the time spent in the block to ``times[phase]``.
+
+    ``progress(phase)`` is called on entry; it may raise to abort the solve.
+    """
+    if progress is not None:
+        progress(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if times is not None:
+            times[phase] = times.get(phase, 0.0) + time.perf_counter() - start
+
+
+def rss_mb():
+    """Current resident set size of this process, None where unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    """Peak resident set size over the lifetime of this process, None where
+    unknown. Only meaningful per solve in a fresh process, see rss_mb."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+class MeshHierarchy:
+    """Meshes the geometry of a mesh card once and refines it level by level.
+
+    Every level is handed out as a copy of the current netgen mesh, so
+    splits and curving never touch the mesh that is refined further. Levels
+    are kept, asking for a level twice returns the same mesh.
+    """
+
+    def __init__(self, mesh_type, extras=()):
+        self.mesh_type = mesh_type
+        self.extras = list(extras)
+        self._ngmesh = None
+        self._level = 0
+        self._meshes = {}
+
+    def _coarse_mesh(self):
+        if self.mesh_type == "Unstructured Mesh":
+            return ngocc.unit_square.GenerateMesh(maxh=0.25)
+        shape = ngocc.Circle((0., 0.), 1).Face()
+        shape.edges.name = "bnd"
+        geo = ngocc.OCCGeometry(shape, dim=2)
+        return geo.GenerateMesh(maxh=1)
+
+    def _refined_mesh(self, ref_lvl):
+        if self._ngmesh is None or ref_lvl < self._level:
+            self._ngmesh = self._coarse_mesh()
+            self._level = 0
+        while self._level < ref_lvl:
+            self._ngmesh.Refine()
+            self._level += 1
+        return ngs.Mesh(self._ngmesh.Copy())
+
+    def level(self, ref_lvl, times=None, progress=None):
+        if ref_lvl not in self._meshes:
+            self._meshes[ref_lvl] = self._make_level(ref_lvl, times, progress)
+        return self._meshes[ref_lvl]
+
+    def forget(self, ref_lvl):
+        """Drop the kept mesh of a level that is not needed again."""
+        self._meshes.pop(ref_lvl, None)
+
+    def _make_level(self, ref_lvl, times=None, progress=None):
+        import ngsolve.meshes as ngs_meshes
+        with timed(times, "mesh", progress):
+            if self.mesh_type in ("Unstructured Mesh", "Curved Mesh"):
+                mesh = self._refined_mesh(ref_lvl)
+            elif self.mesh_type == "Type One Mesh":
+                mesh = ngs_meshes.MakeStructured2DMesh(quads=False, nx=2**(ref_lvl+1), ny=2**(ref_lvl+1))
+            else:  # self.mesh_type == "Singular Vertex Mesh":
+                mesh = ngs_meshes.MakeStructured2DMesh(quads=True, nx=2**(ref_lvl+1), ny=2**(ref_lvl+1))
+                # split quads in 4 trigs?
+        for extra in self.extras:
+            if extra == "Alfeld Split":
+                with timed(times, "split", progress):
+                    ngmesh = mesh.ngmesh.Copy()
+                    ngmesh.Compress()
+                    ngmesh.SplitAlfeld()
+                    mesh = ngs.Mesh(ngmesh)
+            elif extra == "Powell-Sabin Split":
+                with timed(times, "split", progress):
+                    ngmesh = mesh.ngmesh.Copy()
+                    ngmesh.Compress()
+                    ngmesh.SplitPowellSabin()
+                    mesh = ngs.Mesh(ngmesh)
+        if self.mesh_type == "Curved Mesh":
+            with timed(times, "curve", progress):
+                mesh.Curve(5)
+        return mesh
+
+
+class ExactSolution:
+    """Manufactured velocity and pressure of the problem posed on a mesh card.
+
+    The derivative trees are built once and compiled; use exact_solution()
+    to share one instance across levels and validations.
+    """
+
+    def __init__(self, mesh_type, realcompile=False):
+        from math import pi
+        self.uexact = ngs.CF((ngs.sin(pi*ngs.x)*ngs.cos(pi*ngs.y), -ngs.cos(pi*ngs.x)*ngs.sin(pi*ngs.y)))
+        self.uexactbnd = self.uexact
+        self.pexact = ngs.sin(pi*ngs.x)*ngs.cos(pi*ngs.y)         
+
+        if mesh_type == "Curved Mesh":
+            r = ngs.sqrt(ngs.x**2 + ngs.y**2)
+            self.uexact = ngs.CF((ngs.cos(0.5*pi*r)*ngs.y, -ngs.cos(0.5*pi*r)*ngs.x))
+            self.uexactbnd = ngs.CF((0,0))
+            self.pexact = ngs.sin(pi*ngs.x)*ngs.cos(pi*ngs.y)         
+
+        self.graduexact = ngs.CF((self.uexact[0].Diff(ngs.x),self.uexact[0].Diff(ngs.y),                    
+                                  self.uexact[1].Diff(ngs.x),self.uexact[1].Diff(ngs.y)),dims=(2,2))
+        self.m_nu_lap_u_exact = ngs.CF((- self.uexact[0].Diff(ngs.x).Diff(ngs.x) - self.uexact[0].Diff(ngs.y).Diff(ngs.y),
+                    - self.uexact[1].Diff(ngs.x).Diff(ngs.x) - self.uexact[1].Diff(ngs.y).Diff(ngs.y)))
+        self.nabla_p_exact = ngs.CF((self.pexact.Diff(ngs.x), self.pexact.Diff(ngs.y)))
+
+        for name in ("uexact", "uexactbnd", "pexact", "graduexact", "m_nu_lap_u_exact", "nabla_p_exact"):
+            setattr(self, name, getattr(self, name).Compile(realcompile=realcompile, wait=True))
+
+
+@lru_cache(maxsize=None)
+def exact_solution(mesh_type):
+    return ExactSolution(mesh_type, REALCOMPILE)
+
+
+Velocities = namedtuple("Velocities",
+                        "u v gradu gradv divu divv uOther vOther graduOther gradvOther uhat vhat")
+
+
+def _velocity_functions(trial, test, uhat=None, vhat=None):
+    """Velocity trial and test functions with their derivatives; a pair of
+    (space, bubbles) functions stands for their sum."""
+    if isinstance(trial, (tuple, list)):
+        (us, ub), (vs, vb) = trial, test
+        return Velocities(us + ub, vs + vb, ngs.Grad(us) + ngs.Grad(ub), ngs.Grad(vs) + ngs.Grad(vb),
+                          ngs.div(us) + ngs.div(ub), ngs.div(vs) + ngs.div(vb),
+                          us.Other() + ub.Other(), vs.Other() + vb.Other(),
+                          ngs.Grad(us.Other())+ngs.Grad(ub.Other()), ngs.Grad(vs.Other())+ngs.Grad(vb.Other()),
+                          uhat, vhat)
+    return Velocities(trial, test, ngs.Grad(trial), ngs.Grad(test), ngs.div(trial), ngs.div(test),
+                      trial.Other(), test.Other(), ngs.Grad(trial.Other()), ngs.Grad(test.Other()),
+                      uhat, vhat)
+
+
+def _velocity_block(w, disc, mesh, k):
+    """The velocity-velocity terms of the form; hybridized if ``w`` has
+    facet unknowns."""
+    u, v, gradu, gradv = w.u, w.v, w.gradu, w.gradv
+    n = ngs.specialcf.normal(mesh.dim)
+    h = ngs.specialcf.mesh_size
+    velocity_block = ngs.InnerProduct(gradu, gradv) * ngs.dx
+    if w.uhat is not None:
+        uhat, vhat = w.uhat, w.vhat
+        dS = ngs.dx(element_boundary=True)
+        velocity_block += -gradu*n * (v-vhat) * dS
+        velocity_block += -gradv*n * (u-uhat) * dS
+        velocity_block += 20* (k+1)**2 / h * (u-uhat) * (v-vhat) * dS
+    elif disc.interior_penalty:
+        uOther, vOther = w.uOther, w.vOther
+        graduOther, gradvOther = w.graduOther, w.gradvOther
+        velocity_block += 0.5*(-gradu*n-graduOther*n) * (v-vOther) * ngs.dx(skeleton=True)
+        velocity_block += 0.5*(-gradv*n-gradvOther*n) * (u-uOther) * ngs.dx(skeleton=True)
+        velocity_block += 20* (k+1)**2 / h * (u-uOther) * (v-vOther) * ngs.dx(skeleton=True)
+        velocity_block += -gradu*n * v * ngs.ds(skeleton=True)
+        velocity_block += -gradv*n * u * ngs.ds(skeleton=True)
+        velocity_block += 20* (k+1)**2 / h * u * v * ngs.ds(skeleton=True)
+    if disc.graddiv:
+        velocity_block += 1e3 * w.divu * w.divv * ngs.dx
+        velocity_block += 1e3 * u*n * v*n * ngs.dx(skeleton=True)
+    return velocity_block
+
+
+def _velocity_loads(w, disc, mesh, k, exact):
+    """The velocity terms of every right hand side; the first one carries
+    the boundary data of the interior penalty form."""
+    v = w.v
+    n = ngs.specialcf.normal(mesh.dim)
+    h = ngs.specialcf.mesh_size
+    f = (exact.m_nu_lap_u_exact + exact.nabla_p_exact)*v*ngs.dx
+    if disc.interior_penalty and w.uhat is None:
+        f += -w.gradv*n * exact.uexactbnd * ngs.ds(skeleton=True)
+        f += 20* (k+1)**2 / h * exact.uexactbnd * v * ngs.ds(skeleton=True)
+    return [f] + [(exact.m_nu_lap_u_exact + scaling*exact.nabla_p_exact)*v*ngs.dx
+                  for scaling in RHS_SCALINGS]
+
+
+def velocity_key(disc):
+    """Discretizations with the same key have the same velocity space and
+    velocity block."""
+    return disc._replace(pressure=None, stabilizations=())
+
+
+class VelocityBlock:
+    """Velocity space of a level with the velocity block of the matrix and
+    the velocity loads, assembled on first use and shared by every pressure
+    paired with it (see solve_stokes_many)."""
+
+    def __init__(self, disc, mesh, exact):
+        print("Create shared Velocity space")
+        V = disc.velocity.space(mesh, disc.velocity.order, disc.dgjumps)
+        if disc.bubble:
+            V *= p3_bubbles(mesh)
+        w = _velocity_functions(*V.TnT())
+        k = V.globalorder
+        self.V = V
+        self.a = ngs.BilinearForm(_velocity_block(w, disc, mesh, k))
+        self.rhs = [ngs.LinearForm(load) for load in _velocity_loads(w, disc, mesh, k, exact)]
+        self.assembled = False
+
+    def assemble(self):
+        if not self.assembled:
+            self.a.Assemble()
+            for f in self.rhs:
+                f.Assemble()
+            self.assembled = True
+
+
+def _add_block(mat, block):
+    """Add the sparse matrix ``block`` to the leading rows and columns of
+    ``mat``, whose sparsity pattern has room for it."""
+    vals, cols, first = (np.asarray(a) for a in mat.CSR())
+    bvals, bcols, bfirst = (np.asarray(a) for a in block.CSR())
+    n = block.height
+    head = slice(0, int(first[n]))
+    vals, cols = vals[head], cols[head]
+    # columns are sorted, so usually the block is the start of each row
+    inside = cols < block.width
+    counts = np.concatenate(([0], np.cumsum(inside)))[first[:n+1]]
+    if np.array_equal(counts, bfirst) and np.array_equal(cols[inside], bcols):
+        vals[inside] += bvals
+        return
+    rows, brows = (np.repeat(np.arange(n), np.diff(f[:n+1])) for f in (first, bfirst))
+    keys, bkeys = rows * mat.width + cols, brows * mat.width + bcols
+    pos = np.searchsorted(keys, bkeys)
+    if not np.array_equal(keys[np.minimum(pos, len(keys) - 1)], bkeys):
+        raise ValueError("sparsity pattern of the block does not fit the matrix")
+    vals[pos] += bvals
+
+
+class StokesSystem:
+    """Spaces and forms of the Stokes discretization given by the cards.
+
+    The system is regularized with a small pressure mass term only when it
+    is going to be factored directly, and then statically condensed if
+    ``condense`` (default CONDENSE) asks for it and the form allows it.
+    With a VelocityBlock ``velocity`` of the same mesh and velocity key its
+    space is used, and if the system is factored directly and not
+    condensed also its assembled block and loads.
+    """
+
+    def __init__(self, config, mesh, exact, solver=None, condense=None, velocity=None):
+        assert config.velocity is not None
+        assert config.pressure is not None
+        condense = condense or CONDENSE
+        if condense not in ("off", "on", "hdg"):
+            raise ValueError(f"unknown condense option {condense!r}")
+        print("Create Velocity space")
+        disc = discretization(config.velocity, config.pressure, config.extras)
+        velocity_element, pressure = disc.velocity, disc.pressure
+        discontinuous = velocity_element.discontinuous
+        # hybridized interior penalty: the jumps are taken against facet
+        # unknowns instead of the neighbour, so no dgjumps couplings remain
+        hdg = (condense == "hdg" and discontinuous and disc.interior_penalty
+               and not any(s.dgjumps for s in disc.stabilizations) and not disc.bubble
+               and solver_mode(solver) == "direct")
+        dgjumps = disc.dgjumps and not hdg
+        if hdg:
+            V = hdg_velocity(mesh, velocity_element.order)
+            velocity = None
+        elif velocity is not None:
+            V = velocity.V
+        else:
+            V = velocity_element.space(mesh, velocity_element.order, dgjumps)
+            if disc.bubble:
+                V *= p3_bubbles(mesh)
+        bubble_space = disc.bubble
+        print("Create Pressure space")
+        Q = pressure.space(mesh, pressure.order)
+        mode = solver_mode(solver)
+        # only velocity dofs are condensed: the element blocks of the
+        # pressure are just the tiny regularization
+        condense = (condense != "off" and mode == "direct" and not dgjumps
+                    and (hdg or not discontinuous) and not disc.graddiv)
+        if condense:
+            Q.SetCouplingType(ngs.IntRange(0, Q.ndof), ngs.COUPLING_TYPE.WIREBASKET_DOF)
+        shared = velocity is not None and mode == "direct" and not condense
+        fes = V * Q
+        if bubble_space:
+            print("in bubble space")
+            (us, ub, p), (vs, vb, q) = fes.TnT()
+            w = _velocity_functions((us, ub), (vs, vb))
+        elif hdg:
+            (u, uhat, p), (v, vhat, q) = fes.TnT()
+            w = _velocity_functions(u, v, uhat, vhat)
+        else:
+            (u, p), (v, q) = fes.TnT()
+            w = _velocity_functions(u, v)
+        u, v = w.u, w.v
+
+        def avg(u):
+            return 0.5 * (u.Other() + u)
+        n = ngs.specialcf.normal(mesh.dim)
+        h = ngs.specialcf.mesh_size
+        k = V.globalorder
+
+        velocity_block = _velocity_block(w, disc, mesh, k)
+        coupling = - w.divu * q * ngs.dx - w.divv * p * ngs.dx
+        if mode == "direct":
+            coupling += - 1e-8 * p * q * ngs.dx  # to allow for sparsecholesky
+
+        if shared:
+            # the velocity block and loads are added after assembly
+            a = ngs.BilinearForm(coupling)
+            f = ngs.LinearForm(fes)
+            extra_rhs = [ngs.LinearForm(fes) for _ in RHS_SCALINGS]
+        else:
+            a = ngs.BilinearForm(velocity_block + coupling, condense=condense)
+            f, *extra_rhs = (ngs.LinearForm(load) for load in _velocity_loads(w, disc, mesh, k, exact))
+        if hdg:
+            dS = ngs.dx(element_boundary=True)
+            a += p * (v-w.vhat)*n * dS
+            a += q * (u-w.uhat)*n * dS
+        elif disc.interior_penalty:
+            a += avg(p) * (v-w.vOther) * n * ngs.dx(skeleton=True)
+            a += avg(q) * (u-w.uOther) * n * ngs.dx(skeleton=True)
+            a += p*n * v * ngs.ds(skeleton=True)
+            a += q*n * u * ngs.ds(skeleton=True)
+
+            f += q*n * exact.uexactbnd * ngs.ds(skeleton=True)
+
+        for stabilization in disc.stabilizations:
+            a += stabilization.term(p, q, h)
+
+        self.fes, self.V, self.Q = fes, V, Q
+        self.a, self.f = a, f
+        self.rhs = [f] + extra_rhs
+        self.velocity_block = velocity_block
+        self.p, self.q = p, q
+        self.bubble_space = bubble_space
+        self.dgjumps = dgjumps
+        self.mode = mode
+        self.hdg = hdg
+        self.condense = condense
+        self.shared = velocity if shared else None
+        self.discretization = disc
+
+    def assemble(self):
+        self.a.Assemble()
+        for f in self.rhs:
+            f.Assemble()
+        if self.shared is not None:
+            self.shared.assemble()
+            _add_block(self.a.mat, self.shared.a.mat)
+            for f, load in zip(self.rhs, self.shared.rhs):
+                f.vec.Range(0, self.V.ndof).data += load.vec
+
+    def velocity(self, gf):
+        """(velocity, its gradient, its divergence) of a solution ``gf``."""
+        if self.bubble_space:
+            gfu, gfb, gfp = gf.components
+            return gfu + gfb, ngs.Grad(gfu) + ngs.Grad(gfb), ngs.div(gfu) + ngs.div(gfb)
+        gfu = gf.components[0]
+        return gfu, ngs.Grad(gfu), ngs.div(gfu)
+
+    def preconditioner(self):
+        # block-diagonal preconditioner: velocity block and pressure mass matrix,
+        # set up once and reused for all right-hand sides
+        pre_form = ngs.BilinearForm(self.velocity_block + self.p * self.q * ngs.dx)
+        pre = ngs.Preconditioner(pre_form, "direct" if self.dgjumps else "bddc",
+                                 inverse="sparsecholesky")
+        pre_form.Assemble()
+        return pre
+
+    def inverse(self, progress=None):
+        """The factorization, or a Krylov solver that reports the "solve"
+        phase to ``progress`` again while iterating, so it can be aborted."""
+        if self.mode == "direct":
+            return self.a.mat.Inverse(inverse="sparsecholesky",
+                                      freedofs=self.fes.FreeDofs(self.condense))
+        krylov = ngs.solvers.MinResSolver if self.mode == "minres" else ngs.solvers.GMResSolver
+        start = time.perf_counter()
+
+        def callback(iteration, residual):
+            if iteration % KRYLOV_CHECK_EVERY:
+                return
+            if progress is not None:
+                progress("solve")
+            if time.perf_counter() - start > BUDGET_SECONDS:
+                raise RuntimeError(f"{self.mode} did not converge within the budget of "
+                                   f"{BUDGET_SECONDS:g}s ({iteration} iterations)")
+
+        return krylov(mat=self.a.mat, pre=self.preconditioner().mat,
+                      tol=KRYLOV_TOL, maxiter=KRYLOV_MAXITER, callback=callback)
+
+
+def krylov_solve(inv, rhs, sol):
+    """Solve every column of ``rhs`` with the Krylov solver ``inv``; raise
+    if one of them stops before reducing the residual by KRYLOV_TOL."""
+    for i in range(len(rhs)):
+        inv.Solve(rhs=rhs[i], sol=sol[i])
+        residuals = inv.residuals
+        if residuals and residuals[-1] > KRYLOV_TOL * residuals[0]:
+            raise RuntimeError(f"{inv.name} did not converge in {inv.iterations} iterations, "
+                               f"residual reduced by {residuals[-1] / residuals[0]:.1e} only")
+
+
+def solve_stokes(config, mesh, exact, times=None, solver=None, stats=None, progress=None,
+                 condense=None, velocity=None):
+    """Solve for all right hand sides of the system with one factorization.
+
+    Returns the (velocity, gradient, divergence) per right hand side, the
+    mean-corrected pressure of the first one and the velocity and pressure
+    orders. The matrix and its inverse are released before the pressure
+    mean is integrated. ``velocity`` is a VelocityBlock to share.
+    """
+    with timed(times, "spaces", progress):
+        system = StokesSystem(config, mesh, exact, solver, condense, velocity)
+    fes, a = system.fes, system.a
+    with timed(times, "assembly", progress):
+        system.assemble()
+    if stats is not None:
+        stats["ndof"] = fes.ndof
+        stats["nnz"] = a.mat.nze
+        stats["condensed"] = system.condense
+        stats["shared_velocity"] = system.shared is not None
+    gf = ngs.GridFunction(fes)
+    gfu, gfp = gf.components[0], gf.components[-1]
+    #uin = ngs.CF((1.5 * 4 * ngs.y * (0.41 - ngs.y) / (0.41 * 0.41), 0))
+    if system.hdg:
+        gf.components[1].Set(exact.uexactbnd, definedon=mesh.Boundaries(".*"))
+    elif not system.discretization.velocity.discontinuous:
+        gfu.Set(exact.uexactbnd, definedon=mesh.Boundaries(".*"))
+    with timed(times, "factorization", progress):
+        inv = system.inverse(progress)
+    if stats is not None:
+        # Krylov solvers have no factor, their nze raises
+        stats["factor_nnz"] = inv.nze if system.mode == "direct" else None
+        # with the matrix and its factor alive, the most this level holds
+        stats["rss_mb"] = rss_mb()
+    #inv = ngs.directsolvers.SuperLU(a.mat, fes.FreeDofs())
+    with timed(times, "solve", progress):
+        if system.condense:
+            # move the element-interior loads to the coupling dofs
+            for f in system.rhs:
+                f.vec.data += a.harmonic_extension_trans * f.vec
+        # the boundary values are the same for every right hand side, except
+        # that the interior penalty form has them only in the first one
+        # (see _velocity_loads); its hybridized version must not differ
+        lifted = (a.mat * gf.vec).Evaluate()
+        with_data = [True] + [not system.hdg] * (len(system.rhs) - 1)
+        res = ngs.MultiVector(gf.vec, len(system.rhs))
+        for i, f in enumerate(system.rhs):
+            if with_data[i]:
+                res[i].data = f.vec - lifted
+            else:
+                res[i].data = f.vec
+        du = ngs.MultiVector(gf.vec, len(system.rhs))
+        if system.mode == "direct":
+            du[:] = inv * res
+        else:
+            krylov_solve(inv, res, du)
+        del inv, lifted
+        gfs = [gf] + [ngs.GridFunction(fes) for _ in system.rhs[1:]]
+        for i, gfi in enumerate(gfs[1:], 1):
+            if with_data[i]:
+                gfi.vec.data = gf.vec + du[i]
+            else:
+                gfi.vec.data = du[i]
+        gf.vec.data += du[0]
+        del du
+        if system.condense:
+            # recover the element-interior dofs
+            for i, gfi in enumerate(gfs):
+                gfi.vec.data += a.harmonic_extension * gfi.vec
+                gfi.vec.data += a.inner_solve * res[i]
+        del res, a
+    velocities = [system.velocity(gfi) for gfi in gfs]
+    del system
+
+    with timed(times, "errors", progress):
+        mean_p, area = ngs.Integrate(ngs.CF((gfp-exact.pexact, 1)), mesh)
+        offset_p = mean_p/area
+    if stats is not None:
+        stats["h"] = (area / mesh.ne) ** 0.5
+    p = gfp - offset_p
+
+    return velocities, p, gfu.space.globalorder, gfp.space.globalorder
+
+
+LevelErrors = namedtuple("LevelErrors",
+                         "v_l2 v_l2_2 v_h1semi v_h1semi2 v_divl2 p_l2 v_l2_rhs v_h1semi_rhs")
+NORMS = ("v_l2", "v_l2_2", "v_h1semi", "v_h1semi2", "v_divl2", "p_l2")
+
+
+def level_errors(mesh, exact, velocities, p):
+    """All errors of one level in a single pass over the mesh.
+
+    ``velocities`` are (vel, gradvel, divuh) per right hand side, ``p`` the
+    mean-corrected pressure of the first. The *_2 errors are those of the
+    extra right hand side whose H1 error deviates most from the first, the
+    *_rhs ones those of every right hand side.
+    """
+    def h1semi(gradvel):
+        return ngs.InnerProduct(gradvel-exact.graduexact, gradvel-exact.graduexact)
+
+    (vel, gradvel, divuh), extra = velocities[0], velocities[1:]
+    integrands = [(vel-exact.uexact)**2, h1semi(gradvel), divuh**2, (p-exact.pexact)**2]
+    for vel2, gradvel2, divuh2 in extra:
+        integrands += [(vel2-exact.uexact)**2, h1semi(gradvel2)]
+    e = [ngs.sqrt(e) for e in ngs.Integrate(ngs.CF(tuple(integrands)).Compile(), mesh)]
+    v_l2, v_h1semi, v_divl2, p_l2 = e[:4]
+    pairs = list(zip(e[4::2], e[5::2])) or [(v_l2, v_h1semi)]
+    v_l2_2, v_h1semi2 = max(pairs, key=lambda pair: abs(pair[1] - v_h1semi) / pair[1])
+    return LevelErrors(v_l2, v_l2_2, v_h1semi, v_h1semi2, v_divl2, p_l2,
+                       (v_l2,) + tuple(e[4::2]), (v_h1semi,) + tuple(e[5::2]))
+
+
+def convergence_dtype(nrhs=None):
+    """Record of one level of a convergence study."""
+    nrhs = nrhs or 1 + len(RHS_SCALINGS)
+    return np.dtype([("level", int), ("h", float), ("ndof", int)]
+                    + [(norm, float) for norm in NORMS]
+                    + [("v_l2_rhs", float, (nrhs,)), ("v_h1semi_rhs", float, (nrhs,))])
+
+
+def eocs(convergence, norms=NORMS, fit_levels=None):
+    """Convergence rates of ``norms`` in h, fitted by least squares over
+    the last ``fit_levels`` levels (default EOC_FIT_LEVELS), all at once.
+
+    Returns a dict norm -> rate, None for fewer than two levels.
+    """
+    tail = convergence[-(fit_levels or EOC_FIT_LEVELS):]
+    if len(tail) < 2:
+        return dict.fromkeys(norms)
+    x = np.log(tail["h"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = np.log(np.stack([tail[norm] for norm in norms], axis=1))
+        x = x - x.mean()
+        rates = x @ (y - y.mean(axis=0)) / (x @ x)
+    return dict(zip(norms, rates.tolist()))
+
+
+def convergence_records(convergence):
+    """``convergence`` as a list of dicts of plain floats, for JSON."""
+    return [{name: row[name].tolist() for name in convergence.dtype.names}
+            for row in convergence]
+
+
+def convergence_table(convergence):
+    lines = ["level        h     ndof       v_l2   v_h1semi    v_divl2       p_l2"]
+    for row in convergence:
+        lines.append(f"{row['level']:5d} {row['h']:8.4f} {row['ndof']:8d} "
+                     f"{row['v_l2']:10.3e} {row['v_h1semi']:10.3e} "
+                     f"{row['v_divl2']:10.3e} {row['p_l2']:10.3e}")
+    return "\n".join(lines)
+
+
+def solve_stokes_n(config, num_threads=None, solver=None, precheck=None, progress=None,
+                   condense=None):
+    """Run the convergence study of ``config``.
+
+    ``progress(level, nlevels, phase)`` is called when a phase starts, with
+    the 1-based level and ``nlevels`` None for adaptive depth.
+    """
+    with task_manager(num_threads):
+        result, = _solve_many([config], solver, precheck, condense, [progress])
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def solve_stokes_many(configs, num_threads=None, solver=None, precheck=None, condense=None):
+    """Run the convergence studies of several configurations together.
+
+    Configurations with the same mesh card and splits share the mesh levels
+    and the exact solution; those that also share a velocity_key share the
+    velocity space of every level, and, where the system is factored
+    directly and not condensed, its assembled velocity block and loads. The
+    coupling and pressure terms and the factorization stay per pair. Work
+    shared by several pairs is timed on the first of them.
+
+    Returns the results in the order of ``configs``. A pair whose solve
+    raises gets the exception in place of its result, the others go on.
+    """
+    with task_manager(num_threads):
+        return _solve_many(configs, solver, precheck, condense)
+
+
+def _precheck(config, hierarchy, exact, times, progress=None):
+    try:
+        from . import infsup
+    except ImportError:
+        print("scipy not available, skipping inf-sup check")
+        return None
+    with timed(times, "precheck", progress):
+        nlevels = MIN_LEVELS if config.nref == "auto" else min(2, config.nref)
+        return infsup.precheck(config, hierarchy, exact, nlevels)
+
+
+def _clear_cut(eoc_v_h1, eoc_p_l2, velorder, porder, error_v_l2, error_p_l2):
+    """Whether every threshold of the verdict is passed or missed by a margin."""
+    from math import log
+    distances = [eoc_v_h1 - velorder + 0.25, eoc_v_h1 - 0.25,
+                 eoc_p_l2 - 0.25, eoc_p_l2 - porder - 0.75]
+    if any(abs(d) < VERDICT_MARGIN for d in distances):
+        return False
+    # the stability threshold of 0.1 on the last errors, by a factor 2
+    return all(abs(log(e / 0.1)) > log(2) for e in (error_v_l2, error_p_l2))
+
+
+def _another_level(convergence, velorder, porder):
+    """Adaptive depth: whether the verdict needs one more refinement level.
+
+    ``convergence`` holds the levels so far. The next level is estimated
+    to have four times the unknowns of the last one.
+    """
+    last = convergence[-1]
+    nlevels = len(convergence)
+    if not np.isfinite([last["v_h1semi"], last["p_l2"], last["v_l2"]]).all():
+        return False  # the solve broke down, finer levels will not recover
+    if nlevels < MIN_LEVELS:
+        return True
+    if nlevels >= MAX_LEVELS or 4 * last["ndof"] > BUDGET_NDOF:
+        return False
+    if max(last["v_l2"], last["p_l2"]) > 1:
+        return False  # clearly unstable, the rates do not score
+    if min(last["v_l2"], last["p_l2"]) < ERROR_FLOOR:
+        return False  # finer levels would measure the regularization, not the pair
+    rates = eocs(convergence, ("v_h1semi", "p_l2"))
+    if _clear_cut(rates["v_h1semi"], rates["p_l2"], velorder, porder, last["v_l2"], last["p_l2"]):
+        return False
+    if nlevels >= 3:
+        previous = eocs(convergence[:-1], ("v_h1semi", "p_l2"))
+        if all(abs(rates[norm] - previous[norm]) <= EOC_TOL for norm in rates):
+            return False  # settled
+    return True
+
+
+class _Study:
+    """Convergence study of one configuration, solved a level at a time."""
+
+    def __init__(self, config, progress=None):
+        self.config = config
+        self.disc = discretization(config.velocity, config.pressure, config.extras)
+        self.adaptive = config.nref == "auto"
+        self.nlevels = None if self.adaptive else config.nref
+        self.progress = progress
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.level_times = None
+        self.rows = []
+        self.levels = []
+        self.check = None
+        self.fields = self.coarse = None
+        self.ref = 0
+
+    def level_progress(self, phase):
+        if self.progress is not None:
+            self.progress(self.ref + 1, self.nlevels, phase)
+
+    def precheck(self, hierarchy, exact, precheck):
+        """Run the inf-sup check if asked for; False if it rejects the pair."""
+        if precheck != "off":
+            self.check = _precheck(self.config, hierarchy, exact, self.times,
+                                   self.progress and (lambda phase: self.progress(0, self.nlevels, phase)))
+        if precheck == "reject" and self.check is not None and not self.check["stable"]:
+            print("inf-sup check failed:", self.check)
+            return False
+        return True
+
+    def begin_level(self):
+        self.level_times = dict.fromkeys(PHASES, 0.0)
+        self.fields = None  # not the finest level, release it before the next
+
+    def solve_level(self, mesh, exact, solver=None, condense=None, velocity=None):
+        """Solve the current level; False once the study is complete."""
+        stats = {}
+        velocities, gfp, velorder, porder = solve_stokes(self.config, mesh, exact, self.level_times,
+                                                          solver, stats, self.level_progress,
+                                                          condense, velocity)
+        with timed(self.level_times, "errors", self.level_progress):
+            errors = level_errors(mesh, exact, velocities, gfp)
+        vel = velocities[0][0]
+        del velocities
+        if self.ref == 0:
+            self.coarse = (vel, gfp, mesh)  # small, sent to the webgui before the finest level
+        self.fields = (vel, gfp, mesh)
+        self.velorder, self.porder = velorder, porder
+        for phase, t in self.level_times.items():
+            self.times[phase] += t
+        self.levels.append(dict(stats, level=self.ref, phase_times=self.level_times))
+        self.rows.append((self.ref, stats["h"], stats["ndof"]) + tuple(errors))
+        self.study = np.array(self.rows, convergence_dtype(len(errors.v_l2_rhs)))
+        self.ref += 1
+        if self.adaptive:
+            return _another_level(self.study, velorder, porder)
+        return self.ref < self.config.nref
+
+    def rejected(self):
+        check = self.check
+        return {
+            "error_v_l2": [], "error_v_l2_2": [], "error_v_h1semi": [],
+            "error_v_h1semi2": [], "error_v_divl2": [], "error_p_l2": [],
+            "eoc_v_h1": None, "eoc_p_l2": None, "eocs": dict.fromkeys(NORMS),
+            "convergence": np.zeros(0, convergence_dtype()),
+            "is_stable": False, "fields": None, "coarse_fields": None,
+            "phase_times": self.times, "levels": [], "num_threads": ngs.ngsglobals.numthreads,
+            "optconv": None, "prrob": 0,
+            "inf_sup": check["inf_sup"], "spurious_modes": check["spurious_modes"],
+        }
+
+    def result(self):
+        study, check = self.study, self.check
+        velorder, porder = self.velorder, self.porder
+        nref = self.ref
+        print(convergence_table(study))
+        error_v_l2, error_v_l2_2 = study["v_l2"].tolist(), study["v_l2_2"].tolist()
+        error_v_h1semi, error_v_h1semi2 = study["v_h1semi"].tolist(), study["v_h1semi2"].tolist()
+        error_p_l2 = study["p_l2"].tolist()
+        result = {
+            "error_v_l2": error_v_l2,
+            "error_v_l2_2": error_v_l2_2,
+            "error_v_h1semi": error_v_h1semi,
+            "error_v_h1semi2": error_v_h1semi2,
+            "error_v_divl2": study["v_divl2"].tolist(),
+            "error_p_l2": error_p_l2,
+            "eoc_v_h1": None,
+            "eoc_p_l2": None,
+            "eocs": eocs(study),
+            "convergence": study,
+            "is_stable": False,
+            "fields": self.fields,
+            "coarse_fields": self.coarse if nref > 1 else None,
+            "phase_times": self.times,
+            "levels": self.levels,
+            "num_threads": ngs.ngsglobals.numthreads,
+            "inf_sup": check["inf_sup"] if check else None,
+            "spurious_modes": check["spurious_modes"] if check else None,
+        }
+        convergence = True
+        if nref > 1:
+            eoc_v_h1 = result["eocs"]["v_h1semi"]
+            eoc_p_l2 = result["eocs"]["p_l2"]
+            result["eoc_v_h1"], result["eoc_p_l2"] = eoc_v_h1, eoc_p_l2
+
+
+            opt_rates = True
+            convergence = False
+
+            verbose = False
+            if eoc_v_h1 - velorder > - 0.25:
+                if verbose:
+                    print("velocity H1(semi) error optimal")
+            else:
+                opt_rates = False
+
+            if eoc_v_h1 > 0.25 and eoc_p_l2 > 0.25:
+                convergence = True
+            else:
+                if verbose:
+                    print("no convergence")
+
+            if eoc_p_l2 - porder - 1 > - 0.25:
+                if verbose:
+                    print("pressure L2 error optimal")
+            else:
+                opt_rates = False
+
+            if opt_rates:
+                result["optconv"] = 2
+            else:
+                result["optconv"] = 0
+
+        else:
+            result["optconv"] = None
+
+
+        if error_p_l2[-1]< 0.1 and error_v_l2[-1] < 0.1:
+            result["is_stable"] = True
+
+        result["prrob"] = 0
+        if convergence:
+            if abs(error_v_h1semi2[-1]-error_v_h1semi[-1])/error_v_h1semi2[-1] < 5e-2:
+                result["prrob"] = 2
+        return result
+
+
+def _solve_many(configs, solver=None, precheck=None, condense=None, progresses=None):
+    precheck = precheck or PRECHECK
+    if precheck not in ("off", "report", "reject"):
+        raise ValueError(f"unknown precheck mode {precheck!r}")
+    results = [None] * len(configs)
+    groups = {}
+    for i, config in enumerate(configs):
+        groups.setdefault(mesh_key(config), []).append(i)
+    for (mesh_type, splits), members in groups.items():
+        exact = exact_solution(mesh_type)
+        hierarchy = MeshHierarchy(mesh_type, splits)
+        studies = {}
+        for i in members:
+            try:
+                study = _Study(configs[i], progresses[i] if progresses else None)
+                if study.precheck(hierarchy, exact, precheck):
+                    studies[i] = study
+                else:
+                    results[i] = study.rejected()
+            except Exception as e:
+                results[i] = e
+        ref = 0
+        while studies:
+            mesh = velocity = None
+            for study in studies.values():
+                study.begin_level()
+            first = next(iter(studies.values()))
+            print("Create mesh")
+            try:
+                mesh = hierarchy.level(ref, first.level_times, first.level_progress)
+            except Exception as e:
+                for i in studies:
+                    results[i] = e
+                break
+            hierarchy.forget(ref)
+            by_velocity = {}
+            for i, study in studies.items():
+                by_velocity.setdefault(velocity_key(study.disc), []).append(i)
+            for shared in by_velocity.values():
+                velocity = None
+                for i in shared:
+                    study = studies[i]
+                    try:
+                        if velocity is None and len(shared) > 1:
+                            with timed(study.level_times, "spaces", study.level_progress):
+                                velocity = VelocityBlock(study.disc, mesh, exact)
+                        more = study.solve_level(mesh, exact, solver, condense, velocity)
+                    except Exception as e:
+                        results[i] = e
+                        del studies[i]
+                        continue
+                    if not more:
+                        results[i] = study.result()
+                        del studies[i]
+            ref += 1
+    return results
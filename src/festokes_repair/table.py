@@ -0,0 +1,240 @@
+"""Precomputed verdicts of the card combinations, shipped with the package.
+
+    python -m festokes_repair.table --build -j 8
+    python -m festokes_repair.table --check
+
+The table is an SQLite file next to this module (FESTOKES_TABLE=<file>
+selects another one, FESTOKES_TABLE=off disables it). It stores the
+verdicts, EOCs and errors of every combination with up to one extra card,
+keyed by the combination and its nref, and a fingerprint of the solver
+code and settings. The fingerprint hashes the syntax trees of the code, so
+comment and docstring edits keep the table current. A table whose
+fingerprint does not match is stale and ignored, combinations missing
+from it are solved live; tests/test_table.py fails until it is rebuilt.
+The build solves the combinations of one velocity card on one mesh
+together, see batch.sweeps.
+
+The fields of a hit are those of the coarsest level, stored if the table
+was built with --previews. Otherwise a hit has no fields; the backend
+answers the verdict at once and solves the coarsest level as a normal
+task, see backend.Backend.
+"""
+import argparse
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+PATH = os.path.join(os.path.dirname(__file__), "results.sqlite")
+TABLE = os.environ.get("FESTOKES_TABLE", PATH)
+
+# result entries kept in the table, the rest is per-run instrumentation
+STORED = [
+    "error_v_l2", "error_v_l2_2", "error_v_h1semi", "error_v_h1semi2",
+    "error_v_divl2", "error_p_l2", "eoc_v_h1", "eoc_p_l2", "eocs",
+    "is_stable", "optconv", "prrob", "inf_sup", "spurious_modes",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS results (
+    mesh TEXT, pressure TEXT, velocity TEXT, extras TEXT, nref TEXT,
+    is_stable INTEGER, optconv INTEGER, prrob INTEGER,
+    eoc_v_h1 REAL, eoc_p_l2 REAL,
+    result TEXT, preview BLOB,
+    PRIMARY KEY (mesh, pressure, velocity, extras, nref)
+);
+"""
+
+
+def _code(path):
+    """The syntax tree of a module without comments, docstrings and line
+    numbers: only edits that change what the code does change the dump."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if (isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+                and body and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str)):
+            node.body = body[1:] or [ast.Pass()]
+    return ast.dump(tree)
+
+
+@lru_cache(maxsize=None)
+def fingerprint():
+    """Hash of the solver code, the elements and cards it solves, the
+    inf-sup check and the settings the verdicts depend on, computed once
+    per process."""
+    from . import cards, elements, solver
+    # not imported: the inf-sup check needs scipy, which may be missing
+    infsup = os.path.join(os.path.dirname(__file__), "infsup.py")
+    digest = hashlib.sha1()
+    for path in (solver.__file__, elements.__file__, cards.__file__, infsup):
+        digest.update(_code(path).encode())
+    settings = (solver.RHS_SCALINGS, solver.SOLVER, solver.PRECHECK,
+                solver.CONDENSE, solver.MIN_LEVELS, solver.MAX_LEVELS, solver.EOC_TOL,
+                solver.VERDICT_MARGIN, solver.ERROR_FLOOR, solver.EOC_FIT_LEVELS,
+                solver.BUDGET_NDOF)
+    digest.update(repr(settings).encode())
+    return digest.hexdigest()
+
+
+def _key(config):
+    return (config.mesh, config.pressure, config.velocity, ",".join(config.extras),
+            str(config.nref))
+
+
+class ResultTable:
+    """Read access to a table file; ``get`` returns None for anything it
+    cannot answer, including a missing or stale file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._usable = None
+
+    def _open(self):
+        if self._usable is None:
+            self._usable = False
+            if not os.path.exists(self.path):
+                return False
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            row = db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != fingerprint():
+                print(f"result table {self.path} is stale, solving live")
+                db.close()
+                return False
+            self._db, self._usable = db, True
+        return self._usable
+
+    def get(self, config):
+        with self._lock:
+            if not self._open():
+                return None
+            row = self._db.execute(
+                "SELECT result, preview FROM results WHERE mesh = ? AND pressure = ? "
+                "AND velocity = ? AND extras = ? AND nref = ?", _key(config)).fetchone()
+        if row is None:
+            return None
+        result, preview = row
+        result = json.loads(result)
+        fields = pickle.loads(zlib.decompress(preview)) if preview is not None else None
+        result.update(fields=fields, coarse_fields=None, phase_times={}, levels=[],
+                      num_threads=None, from_table=True)
+        return result
+
+
+def preview_fields(config):
+    """(velocity, pressure, mesh) of ``config`` on the coarsest level."""
+    from . import solver
+    with contextlib.redirect_stdout(sys.stderr):
+        return solver.solve_stokes_n(config._replace(nref=1), 1, precheck="off")["fields"]
+
+
+def _evaluate(configs, previews):
+    from .batch import evaluate_many
+    rows = evaluate_many(configs)
+    for config, row in zip(configs, rows):
+        if previews and not row.get("error"):
+            row["preview"] = zlib.compress(pickle.dumps(preview_fields(config)))
+    return list(zip(configs, rows))
+
+
+def build(path, configs, jobs=None, previews=False):
+    """Solve ``configs`` and write them to a fresh table at ``path``."""
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    db.executescript(SCHEMA)
+    import ngsolve
+    meta = {"fingerprint": fingerprint(), "built": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "ngsolve": ngsolve.__version__}
+    db.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+    from .batch import sweeps
+    failed = i = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_evaluate, sweep, previews) for sweep in sweeps(configs)]
+        for future in as_completed(futures):
+            for config, row in future.result():
+                i += 1
+                if row.get("error"):
+                    failed += 1
+                    print(f"[{i}/{len(configs)}] {_key(config)}: {row['error']}, left out",
+                          file=sys.stderr)
+                    continue
+                result = {k: row.get(k) for k in STORED}
+                db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           _key(config) + (row["is_stable"], row["optconv"], row["prrob"],
+                                           row["eoc_v_h1"], row["eoc_p_l2"], json.dumps(result),
+                                           row.get("preview")))
+                print(f"[{i}/{len(configs)}] {_key(config)}: {row['time']:.1f}s", file=sys.stderr)
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+    os.replace(tmp, path)
+    return len(configs) - failed, failed
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def result_table():
+    """The process-wide table selected by FESTOKES_TABLE, None if disabled."""
+    global _table
+    if TABLE == "off":
+        return None
+    with _table_lock:
+        if _table is None:
+            _table = ResultTable(TABLE)
+        return _table
+
+
+def main(argv=None):
+    from .batch import configurations, _nref
+    parser = argparse.ArgumentParser(prog="python -m festokes_repair.table",
+                                     description="Build or check the precomputed result table.")
+    parser.add_argument("--build", action="store_true", help="solve every combination and write the table")
+    parser.add_argument("--check", action="store_true", help="report whether the table is current")
+    parser.add_argument("--path", default=TABLE if TABLE != "off" else PATH)
+    parser.add_argument("--nref", type=_nref, nargs="+", default=[3])
+    parser.add_argument("--max-extras", type=int, default=1)
+    parser.add_argument("--previews", action="store_true",
+                        help="also store the coarsest-level fields, makes the table much larger")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    if args.build:
+        configs = [config for nref in args.nref
+                   for config in configurations(max_extras=args.max_extras, nref=nref)]
+        print(f"building {args.path} from {len(configs)} combinations", file=sys.stderr)
+        stored, failed = build(args.path, configs, args.jobs, args.previews)
+        print(f"{stored} combinations stored, {failed} failed", file=sys.stderr)
+    if args.check or not args.build:
+        if not os.path.exists(args.path):
+            print(f"{args.path}: missing")
+            return 1
+        db = sqlite3.connect(args.path)
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        count, = db.execute("SELECT COUNT(*) FROM results").fetchone()
+        current = meta.get("fingerprint") == fingerprint()
+        print(f"{args.path}: {count} combinations, built {meta.get('built')} "
+              f"with NGSolve {meta.get('ngsolve')}, {'current' if current else 'STALE'}")
+        return 0 if current else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from festokes_repair import backend
+from festokes_repair.cache import ResultCache
+from festokes_repair.cards import configuration
+
+CONFIGS = [configuration("Type One Mesh", pressure, velocity, (), 2)
+           for pressure, velocity in [("P1", "P2"), ("P0", "Crouzeix-Raviart"),
+                                      ("P1*", "BDM2"), ("P0", "P1")]]
+
+
+@pytest.fixture(autouse=True)
+def no_stored_results(monkeypatch):
+    monkeypatch.setattr(backend, "result_cache", ResultCache(maxsize=16))
+    monkeypatch.setattr(backend, "result_table", lambda: None)
+
+
+def looked_up(pool):
+    """Wait until the submitted tickets went past the cache and the table."""
+    pool._lookups.submit(lambda: None).result(10)
+
+
+def test_overlapping_solves_on_threads():
+    pool = backend.ThreadBackend(workers=len(CONFIGS))
+    results, errors = {}, []
+    tickets = [pool.submit(i, config, on_done=lambda r, c=config: results.__setitem__(c, r),
+                           on_error=errors.append)
+               for i, config in enumerate(CONFIGS)]
+    for ticket in tickets:
+        assert ticket.wait(120)
+    assert errors == []
+    assert set(results) == set(CONFIGS)
+    assert all(len(results[c]["error_p_l2"]) == 2 for c in CONFIGS)
+    assert pool.metrics()["completed"] == len(CONFIGS)
+
+
+class FailingBackend(backend.Backend):
+    def __init__(self):
+        super().__init__(workers=1)
+        self.starts = 0
+
+    def _start(self, task):
+        self.starts += 1
+        if self.starts == 1:
+            raise RuntimeError("cannot start")
+        threading.Thread(target=self._finish, args=(task, {"ok": True})).start()
+
+
+class SlowTable:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def get(self, config):
+        self.release.wait(10)
+        return {"is_stable": True, "fields": "fields"}
+
+
+def test_submit_does_not_wait_for_the_lookup(monkeypatch):
+    table = SlowTable()
+    monkeypatch.setattr(backend, "result_table", lambda: table)
+    pool = backend.ThreadBackend()
+    results = []
+    ticket = pool.submit(0, CONFIGS[0], on_done=results.append)
+    assert not ticket.done() and results == []
+    table.release.set()
+    assert ticket.wait(10)
+    assert results == [{"is_stable": True, "fields": "fields"}]
+    assert pool.metrics()["table_hits"] == 1
+
+
+def test_a_full_queue_fails_the_ticket(monkeypatch):
+    monkeypatch.setattr(backend.metrics, "record", lambda config, result: None)
+    release = threading.Event()
+    pool = backend.ThreadBackend(max_queue=0, solve=lambda config, progress: release.wait(10))
+    errors = []
+    assert pool.submit(0, CONFIGS[0], on_error=errors.append).wait(10)
+    assert [type(e) for e in errors] == [backend.QueueFull]
+    release.set()
+
+
+def test_failed_start_fails_the_waiters_and_frees_the_task(monkeypatch):
+    monkeypatch.setattr(backend.metrics, "record", lambda config, result: None)
+    pool = FailingBackend()
+    errors = []
+    first = pool.submit(0, CONFIGS[0], on_error=errors.append)
+    assert first.wait(10)
+    assert [str(e) for e in errors] == ["cannot start"]
+    results = []
+    second = pool.submit(1, CONFIGS[0], on_done=results.append)
+    assert second.wait(10)
+    assert results == [{"ok": True}]
+    assert pool.metrics()["running"] == 0
+
+
+def test_process_pool_recovers_from_a_dead_worker():
+    import os
+    import signal
+    pool = backend.ProcessPoolBackend(workers=1)
+    results = []
+    assert pool.submit(0, CONFIGS[0], on_done=results.append).wait(120)
+    for process in list(pool._pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    errors = []
+    ticket = pool.submit(1, CONFIGS[3], on_done=results.append, on_error=errors.append)
+    assert ticket.wait(120)
+    if errors:  # the breakage may only be noticed by this task, the next one runs
+        assert pool.submit(2, CONFIGS[3], on_done=results.append).wait(120)
+    assert len(results) == 2
+    assert pool.metrics()["running"] == 0
+
+
+class FieldlessTable:
+    def get(self, config):
+        return {"is_stable": True, "fields": None, "from_table": True}
+
+
+def test_table_hit_answers_at_once_and_solves_the_preview_as_a_task(monkeypatch):
+    monkeypatch.setattr(backend, "result_table", FieldlessTable)
+    monkeypatch.setattr(backend.metrics, "record", lambda config, result: None)
+    solved, release = [], threading.Event()
+
+    def solve(config, progress):
+        release.wait(10)
+        solved.append(config)
+        return {"fields": ("velocity", "pressure", "mesh")}
+
+    pool = backend.ThreadBackend(solve=solve)
+    answers = []
+    tickets = [pool.submit(session, CONFIGS[0], on_done=answers.append) for session in range(2)]
+    looked_up(pool)
+    assert [answer["fields"] for answer in answers] == [None, None]
+    assert not any(ticket.done() for ticket in tickets)
+    release.set()
+    assert all(ticket.wait(10) for ticket in tickets)
+    assert solved == [CONFIGS[0]._replace(nref=1)]
+    assert [answer["fields"] for answer in answers[2:]] == [("velocity", "pressure", "mesh")] * 2
+    assert answers[2]["is_stable"]
+    assert pool.metrics()["merged"] == 1
+
+
+def test_sessions_asking_for_the_same_combination_share_one_task(monkeypatch):
+    monkeypatch.setattr(backend.metrics, "record", lambda config, result: None)
+    solved, release = [], threading.Event()
+
+    def solve(config, progress):
+        release.wait(10)
+        solved.append(config)
+        return {"config": config}
+
+    pool = backend.ThreadBackend(solve=solve)
+    results = []
+    tickets = [pool.submit(session, CONFIGS[session % 2], on_done=results.append)
+               for session in range(4)]
+    looked_up(pool)
+    release.set()
+    assert all(ticket.wait(10) for ticket in tickets)
+    assert sorted(solved) == sorted(CONFIGS[:2])
+    assert len(results) == 4
+    assert pool.metrics()["merged"] == 2
+    # and the next one comes from the cache
+    assert pool.submit(5, CONFIGS[0], on_done=results.append).wait(10)
+    assert pool.metrics()["cache_hits"] == 1
+
+
+def test_cancelled_tickets_get_no_callbacks_and_stop_their_task(monkeypatch):
+    monkeypatch.setattr(backend.metrics, "record", lambda config, result: None)
+    started, release, phases = threading.Event(), threading.Event(), []
+
+    def solve(config, progress):
+        started.set()
+        release.wait(10)
+        progress(1, 2, "solve")
+        phases.append(config)
+        return {"config": config}
+
+    pool = backend.ThreadBackend(solve=solve)
+    calls = []
+    running = pool.submit(0, CONFIGS[0], on_done=calls.append, on_error=calls.append)
+    queued = pool.submit(1, CONFIGS[1], on_done=calls.append, on_error=calls.append)
+    looked_up(pool)
+    assert started.wait(10)
+    running.cancel()
+    queued.cancel()
+    assert running.done() and queued.done()
+    release.set()
+    for _ in range(100):
+        if pool.metrics()["running"] == 0:
+            break
+        threading.Event().wait(0.1)
+    assert calls == [] and phases == []
+    metrics = pool.metrics()
+    assert (metrics["cancelled"], metrics["running"], metrics["queued"]) == (2, 0, 0)
+
+
+class DeadPool:
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(RuntimeError("worker died"))
+        return future
+
+
+def test_process_pool_task_that_is_done_at_once():
+    pool = backend.ProcessPoolBackend(workers=1)
+    pool._pool = DeadPool()
+    errors = []
+    assert pool.submit(0, CONFIGS[0], on_error=errors.append).wait(10)
+    assert [str(e) for e in errors] == ["worker died"]
+    assert pool.metrics()["running"] == 0
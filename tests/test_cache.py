@@ -0,0 +1,41 @@
+import pickle
+
+from festokes_repair.cache import ResultCache
+
+
+def test_least_recently_used_entries_are_dropped():
+    cache = ResultCache(maxsize=2, fingerprint=lambda: "a")
+    cache.put(1, "one")
+    cache.put(2, "two")
+    assert cache.get(1) == "one"
+    cache.put(3, "three")
+    assert (cache.get(1), cache.get(2), cache.get(3)) == ("one", None, "three")
+
+
+def test_results_are_handed_out_as_copies():
+    cache = ResultCache(fingerprint=lambda: "a")
+    cache.put("key", {"levels": []})
+    cache.get("key")["levels"].append(1)
+    assert cache.get("key") == {"levels": []}
+
+
+def test_results_are_read_back_from_disk(tmp_path):
+    ResultCache(directory=tmp_path, fingerprint=lambda: "a").put("key", {"prrob": 1})
+    assert ResultCache(directory=tmp_path, fingerprint=lambda: "a").get("key") == {"prrob": 1}
+
+
+def test_results_of_another_fingerprint_are_ignored(tmp_path):
+    ResultCache(directory=tmp_path, fingerprint=lambda: "a").put("key", {"prrob": 1})
+    cache = ResultCache(directory=tmp_path, fingerprint=lambda: "b")
+    assert cache.get("key") is None
+    # even if stored under the same name
+    (path,) = tmp_path.iterdir()
+    path.rename(cache._path("key"))
+    assert cache.get("key") is None
+
+
+def test_entries_in_the_old_format_are_ignored(tmp_path):
+    cache = ResultCache(directory=tmp_path, fingerprint=lambda: "a")
+    with open(cache._path("key"), "wb") as f:
+        pickle.dump(pickle.dumps({"prrob": 1}), f)
+    assert cache.get("key") is None
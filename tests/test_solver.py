@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from festokes_repair import solver
+from festokes_repair.cards import configuration
+
+TAYLOR_HOOD = configuration("Unstructured Mesh", "P1", "P2", (), 2)
+
+
+@pytest.mark.parametrize("mode", ["minres", "gmres"])
+def test_krylov_solvers_match_the_direct_one(mode):
+    direct = solver.solve_stokes_n(TAYLOR_HOOD, 1, "direct")
+    krylov = solver.solve_stokes_n(TAYLOR_HOOD, 1, mode)
+    assert krylov["error_v_h1semi"] == pytest.approx(direct["error_v_h1semi"], rel=1e-6)
+    assert krylov["error_p_l2"] == pytest.approx(direct["error_p_l2"], rel=1e-6)
+    assert krylov["levels"][-1]["factor_nnz"] is None
+    assert direct["levels"][-1]["factor_nnz"] > 0
+
+
+def test_krylov_solves_that_do_not_converge_fail(monkeypatch):
+    monkeypatch.setattr(solver, "KRYLOV_MAXITER", 5)
+    with pytest.raises(RuntimeError, match="did not converge in 5 iterations"):
+        solver.solve_stokes_n(TAYLOR_HOOD, 1, "minres")
+
+
+def test_krylov_solves_can_be_aborted_while_iterating(monkeypatch):
+    monkeypatch.setattr(solver, "KRYLOV_CHECK_EVERY", 1)
+    solves = []
+
+    def progress(level, nlevels, phase):
+        if phase == "solve":
+            solves.append(level)
+            if len(solves) > 2:
+                raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        solver.solve_stokes_n(TAYLOR_HOOD, 1, "gmres", progress=progress)
+    assert solves == [1, 1, 1]
+
+
+def test_hybridized_interior_penalty_has_the_same_boundary_data():
+    # only the first right hand side carries boundary data in the interior
+    # penalty form, the hybridized one must not lift the others
+    config = configuration("Unstructured Mesh", "P1*", "P2*", ("Interior Penalty",), 3)
+    ip = solver.solve_stokes_n(config, 1, condense="off")
+    hdg = solver.solve_stokes_n(config, 1, condense="hdg")
+    assert hdg["levels"][-1]["condensed"]
+    assert hdg["error_v_l2_2"][-1] == pytest.approx(ip["error_v_l2_2"][-1], rel=0.05)
+    assert (hdg["is_stable"], hdg["prrob"]) == (ip["is_stable"], ip["prrob"])
+
+
+def test_eocs_are_the_slopes_of_the_last_levels():
+    h = 0.5 ** np.arange(4)
+    convergence = np.zeros(len(h), solver.convergence_dtype())
+    convergence["h"] = h
+    for k, norm in enumerate(solver.NORMS, start=1):
+        convergence[norm] = h ** k
+    # first order on the coarse levels, second on the last two
+    convergence["p_l2"] = [1.0, 0.5, 0.25, 0.0625]
+    rates = solver.eocs(convergence)
+    for k, norm in enumerate(solver.NORMS[:-1], start=1):
+        assert rates[norm] == pytest.approx(k)
+    assert rates["p_l2"] == pytest.approx(2)
+    assert 1 < solver.eocs(convergence, fit_levels=4)["p_l2"] < 2
+    assert solver.eocs(convergence[:1]) == dict.fromkeys(solver.NORMS)
+
+
+def study(velocity_rate, pressure_rate, nlevels=2):
+    h = 0.5 ** np.arange(nlevels)
+    convergence = np.zeros(nlevels, solver.convergence_dtype())
+    convergence["h"], convergence["ndof"] = h, 100 * 4 ** np.arange(nlevels)
+    for norm in solver.NORMS:
+        convergence[norm] = 1e-2 * h ** velocity_rate
+    convergence["p_l2"] = 1e-2 * h ** pressure_rate
+    return convergence
+
+
+def test_optimal_pairs_stop_after_two_levels():
+    # Taylor-Hood P2/P1: velocity H1 rate 2, pressure L2 rate 2
+    assert not solver._another_level(study(2, 2), 2, 1)
+    assert not solver._another_level(study(1.95, 2.1), 2, 1)
+    assert solver._another_level(study(2, 2, nlevels=1), 2, 1)
+    # a rate right at a threshold needs more levels
+    assert solver._another_level(study(1.8, 2), 2, 1)
+    assert not solver._another_level(study(1.8, 2, nlevels=solver.MAX_LEVELS), 2, 1)
+
+
+MIXED = [
+    configuration("Unstructured Mesh", "P1", "P2", (), 2),
+    configuration("Unstructured Mesh", "P0", "P2", (), 2),
+    configuration("Unstructured Mesh", "P1*", "P2*", ("Interior Penalty",), 2),
+    configuration("Unstructured Mesh", "P0", "P1", ("P3 Bubble",), 2),
+    configuration("Unstructured Mesh", "P1*", "P2", ("Alfeld Split",), 2),
+    configuration("Singular Vertex Mesh", "P0", "Crouzeix-Raviart", (), 2),
+]
+
+
+def test_solving_together_matches_solving_alone():
+    together = solver.solve_stokes_many(MIXED, 1)
+    for config, shared in zip(MIXED, together):
+        try:
+            alone = solver.solve_stokes_n(config, 1)
+        except Exception as e:
+            assert type(shared) is type(e), config
+            continue
+        assert isinstance(shared, dict), config
+        for key in ("error_v_l2", "error_v_h1semi", "error_v_l2_2", "error_p_l2"):
+            assert shared[key] == pytest.approx(alone[key], rel=1e-8), (config, key)
+        for key in ("is_stable", "optconv", "prrob"):
+            assert shared[key] == alone[key], (config, key)
+    # no Crouzeix-Raviart element on the quadrilaterals of this mesh
+    assert isinstance(together[-1], Exception)
+    # the two P2 pairs share their velocity block
+    assert all(level["shared_velocity"] for level in together[1]["levels"])
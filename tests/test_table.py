@@ -0,0 +1,19 @@
+from festokes_repair import table
+
+
+def test_fingerprint_ignores_comments_and_docstrings(tmp_path):
+    code = tmp_path / "code.py"
+
+    def fingerprint(source):
+        code.write_text(source)
+        return table._code(code)
+
+    plain = fingerprint("def f(x):\n    return 2 * x\n")
+    assert fingerprint('"""Module."""\n# scaled\ndef f(x):\n    """Twice x."""\n\n'
+                       '    return 2 * x  # by two\n') == plain
+    assert fingerprint("def f(x):\n    return 3 * x\n") != plain
+
+
+def test_shipped_table_is_current():
+    # rebuild with python -m festokes_repair.table --build
+    assert table.main(["--check", "--path", table.PATH]) == 0